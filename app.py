@@ -1,15 +1,208 @@
+import datetime
+import hashlib
 import os
-from flask import Flask, request, abort, jsonify, redirect
+from flask import Flask, request, abort, jsonify, redirect, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-from sqlalchemy import exc
+from sqlalchemy import exc, text
+from sqlalchemy.orm import load_only, selectinload
 import json
 from sqlalchemy.sql import func
 
-from models import setup_db, Movie, Actor, db
-from auth import AuthError, requires_auth
+from models import setup_db, Movie, Actor, db, get_versions
+from auth import AuthError, requires_auth, check_permissions, token_cache, jwks_store
+from pagination import get_page_args, keyset_page, int_arg
+from filters import filter_actors, filter_movies
+from search import search, SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT, SEARCH_MAX_PAGE, SEARCH_MIN_LENGTH, SEARCH_MAX_LENGTH
+from stats import get_stats
+from cache import response_cache
+import instrumentation
+import profiling
+import slow_query
+from serializers import dumps, json_response, get_fields_arg, actor_serializer, movie_serializer, cast_member_serializer
 
 loginURL = os.environ.get('loginURL')
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 1000))
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', 1000))
+MAX_BATCH_OPERATIONS = int(os.environ.get('MAX_BATCH_OPERATIONS', 100))
+MAX_EXTERNAL_KEY_LENGTH = 255
+
+ACTOR_FIELDS = ('name', 'age', 'gender')
+MOVIE_FIELDS = ('title', 'releasedate')
+
+'''
+missing_fields(body, fields)
+    returns the required fields that are absent or blank in a request body
+'''
+def missing_fields(body, fields):
+    return [field for field in fields if body.get(field) is None or body.get(field) == ""]
+
+'''
+parse_movie_values(values)
+    returns values with releasedate parsed from YYYY-MM-DD to a date, which every
+    backend accepts (SQLite's Date type rejects strings). Raises ValueError naming the field.
+'''
+def parse_movie_values(values):
+    if 'releasedate' not in values:
+        return values
+    try:
+        return dict(values, releasedate=datetime.date.fromisoformat(values['releasedate']))
+    except (TypeError, ValueError):
+        raise ValueError('releasedate')
+
+'''
+validate_batch(body, fields, parse=None)
+    checks every record of a bulk request with the single-record rules, then converts
+    it with parse(record) if given. Returns (records, errors) where errors lists
+    {'index', 'missing'} or {'index', 'invalid'} per invalid record.
+    Aborts with 422 if the body is not a non-empty list of at most MAX_BATCH_SIZE items.
+'''
+def validate_batch(body, fields, parse=None):
+    if not isinstance(body, list) or not body or len(body) > MAX_BATCH_SIZE:
+        abort(422)
+
+    records = []
+    errors = []
+    for index, item in enumerate(body):
+        if not isinstance(item, dict):
+            errors.append({'index': index, 'missing': list(fields)})
+            continue
+        missing = missing_fields(item, fields)
+        if missing:
+            errors.append({'index': index, 'missing': missing})
+            continue
+        record = {field: item[field] for field in fields}
+        try:
+            records.append(parse(record) if parse else record)
+        except ValueError as e:
+            errors.append({'index': index, 'invalid': [str(e)]})
+    return records, errors
+
+def valid_external_key(key):
+    return isinstance(key, str) and 0 < len(key) <= MAX_EXTERNAL_KEY_LENGTH
+
+'''
+validate_upserts(body, fields, parse=None)
+    validate_batch() for PUT /<resource>/by-key: every record also needs a string external_key.
+'''
+def validate_upserts(body, fields, parse=None):
+    records, errors = validate_batch(body, fields + ('external_key',), parse)
+    for index, item in enumerate(body):
+        if isinstance(item, dict) and item.get('external_key') is not None and not valid_external_key(item['external_key']):
+            errors.append({'index': index, 'invalid': ['external_key']})
+    return records, sorted(errors, key=lambda error: error['index'])
+
+BATCH_RESOURCES = {'actors': (Actor, ACTOR_FIELDS, None), 'movies': (Movie, MOVIE_FIELDS, parse_movie_values)}
+BATCH_PERMISSIONS = {'create': 'post', 'update': 'patch', 'delete': 'delete'}  #op -> permission prefix, as on the single endpoints
+
+'''
+parse_operation(operation)
+    validates one /batch sub-operation with the rules of the matching single endpoint.
+    Returns (op, permission, model, id, values), raises ValueError with a message otherwise.
+'''
+def parse_operation(operation):
+    if not isinstance(operation, dict):
+        raise ValueError('Operation must be an object')
+    op = operation.get('op')
+    resource = operation.get('resource')
+    if op not in BATCH_PERMISSIONS:
+        raise ValueError("op must be 'create', 'update' or 'delete'")
+    if resource not in BATCH_RESOURCES:
+        raise ValueError("resource must be 'actors' or 'movies'")
+    model, fields, parse = BATCH_RESOURCES[resource]
+    permission = f'{BATCH_PERMISSIONS[op]}:{resource}'
+    data = operation.get('data')
+
+    if op == 'create':
+        if not isinstance(data, dict) or missing_fields(data, fields):
+            raise ValueError(f"data requires {', '.join(fields)}")
+        return op, permission, model, None, parse_data(parse, {field: data[field] for field in fields})
+
+    record_id = operation.get('id')
+    if not isinstance(record_id, int) or isinstance(record_id, bool):
+        raise ValueError('id must be an integer')
+    if op == 'delete':
+        return op, permission, model, record_id, None
+
+    values = {field: data[field] for field in fields if field in data} if isinstance(data, dict) else {}
+    if not values or missing_fields(values, values):
+        raise ValueError(f"data requires at least one of {', '.join(fields)}, none blank")
+    return op, permission, model, record_id, parse_data(parse, values)
+
+def parse_data(parse, values):
+    try:
+        return parse(values) if parse else values
+    except ValueError as e:
+        raise ValueError(f'{e} is invalid')
+
+'''
+run_operation(op, model, id, values)
+    applies a parsed sub-operation without committing. Returns its result in the
+    shape of the single endpoint's response, or None if the id does not exist.
+'''
+def run_operation(op, model, record_id, values):
+    if op == 'create':
+        record = model(**values)
+        record.insert(commit=False)
+        return {'created': record.id}
+    if op == 'update':
+        return {'updated': record_id} if model.update_by_id(record_id, values, commit=False) else None
+    return {'deleted': record_id} if model.delete_by_id(record_id, commit=False) else None
+
+'''
+list_etag(*tables)
+    ETag of a list response: the version counters of the tables it is built from
+    plus a digest of the query string. Costs one primary-key lookup, no row is loaded.
+'''
+def list_etag(*tables):
+    versions = '.'.join(str(version) for version in get_versions(*tables))
+    query = hashlib.sha1(request.query_string).hexdigest()[:16]
+    return f"{'.'.join(tables)}-{versions}-{query}"
+
+def not_modified(etag):
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+
+'''
+cached_list(tables, etag) / cache_list(tables, etag, response)
+    read and fill the response cache for a list endpoint. Called after authorisation
+    and the ETag check, so only the rows and the JSON encoding are skipped on a hit.
+'''
+def cached_list(tables, etag):
+    body = response_cache.get(tables, f'{request.endpoint}:{etag}')
+    if body is None:
+        return None
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['X-Cache'] = 'HIT'
+    return response
+
+def cache_list(tables, etag, response):
+    response.set_etag(etag)
+    response.headers['X-Cache'] = 'MISS'
+    response_cache.set(tables, f'{request.endpoint}:{etag}', response.get_data())
+    return response
+
+'''
+ndjson_export(query, serializer)
+    streams the rows of a query as newline-delimited JSON. Rows are read as column
+    tuples through a server-side cursor EXPORT_CHUNK_SIZE at a time, so memory stays
+    flat however large the table is.
+'''
+def ndjson_export(query, serializer):
+    def generate():
+        lines = []
+        fields = serializer.fields
+        for row in serializer.select(query).execution_options(stream_results=True).yield_per(EXPORT_CHUNK_SIZE):
+            lines.append(dumps(dict(zip(fields, row))))
+            if len(lines) >= EXPORT_CHUNK_SIZE:
+                yield b'\n'.join(lines) + b'\n'
+                lines = []
+        if lines:
+            yield b'\n'.join(lines) + b'\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
 
 def create_app(test_config=None):
@@ -17,34 +210,40 @@ def create_app(test_config=None):
     app = Flask(__name__)
     setup_db(app)
     CORS(app)
+    instrumentation.init_app(app)
+    profiling.init_app(app)  #opt-in, PROFILE_ENABLED
+    slow_query.init_app(app)
+    instrumentation.register_cache_stats('token_cache', token_cache)
+    instrumentation.register_cache_stats('response_cache', response_cache)
   
     @app.after_request
     def after_request(response):
         response.headers.add('Access-Control-Allow-Origin', '*')
         response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,true')
-        response.headers.add('Access-Control-Allow-Methods', 'GET,POST,DELETE,PATCH,OPTIONS')
+        response.headers.add('Access-Control-Allow-Methods', 'GET,POST,PUT,DELETE,PATCH,OPTIONS')
         return response
 
     #GET /actors 
     @app.route('/actors', methods=['GET'])
     @requires_auth('get:actors')
     def retrieve_actors(payload):
+        limit, after = get_page_args()
+        serializer = get_fields_arg(actor_serializer)  #?fields=id,name selects only those columns
+        query = filter_actors(Actor.query, request.args)
+        etag = list_etag('actors')
+        if request.if_none_match.contains(etag):
+            return not_modified(etag)
+        cached = cached_list(('actors',), etag)
+        if cached is not None:
+            return cached
         try:
-            all_actors = Actor.query.order_by(Actor.id).all()
-            
-            actorsList = []
-            for some_actor in all_actors:
-                addData = {}
-                addData["id"] = some_actor.id
-                addData["name"] = some_actor.name
-                addData["age"] = some_actor.age
-                addData["gender"] = some_actor.gender
-                actorsList.append(addData)
+            all_actors, next_cursor = keyset_page(serializer.select(query), Actor.id, limit, after)
 
-            return jsonify({
+            return cache_list(('actors',), etag, json_response({
                 'success': True,
-                'actors': actorsList
-            })
+                'actors': serializer.rows(all_actors),
+                'next': next_cursor
+            }))
         except Exception as e:
             app.logger.error(e)
             abort(404)
@@ -53,40 +252,139 @@ def create_app(test_config=None):
     @app.route('/movies', methods=['GET'])
     @requires_auth('get:movies')
     def retrieve_movies(payload):
+        limit, after = get_page_args()
+        serializer = get_fields_arg(movie_serializer)  #?fields=id,title selects only those columns
+        query = filter_movies(Movie.query, request.args)
+        include = request.args.get('include')
+        if include not in (None, 'cast'):
+            abort(422)
+        if include == 'cast':
+            check_permissions('get:actors', payload)
+            query = query.options(load_only(*serializer.fields), selectinload(Movie.cast))  #one extra query for the whole page instead of one per movie
+        tables = ('movies', 'actors') if include == 'cast' else ('movies',)
+        etag = list_etag(*tables)
+        if request.if_none_match.contains(etag):
+            return not_modified(etag)
+        cached = cached_list(tables, etag)
+        if cached is not None:
+            return cached
         try:
-            all_movies = Movie.query.order_by(Movie.id).all()
-            moviesList = []
-            for some_movie in all_movies:
-                addData = {}
-                addData["id"] = some_movie.id
-                addData["title"] = some_movie.title
-                addData["releasedate"] = some_movie.releasedate
-                moviesList.append(addData)
-
-            return jsonify({
+            if include == 'cast':
+                all_movies, next_cursor = keyset_page(query, Movie.id, limit, after)
+                moviesList = serializer.objects(all_movies)
+                for addData, some_movie in zip(moviesList, all_movies):
+                    addData["cast"] = cast_member_serializer.objects(some_movie.cast)
+            else:
+                all_movies, next_cursor = keyset_page(serializer.select(query), Movie.id, limit, after)
+                moviesList = serializer.rows(all_movies)
+
+            return cache_list(tables, etag, json_response({
                 'success': True,
-                'movies': moviesList
-            })
+                'movies': moviesList,
+                'next': next_cursor
+            }))
         except Exception as e:
             app.logger.error(e)
             abort(404)
 
+    #GET /movies/<movie_id>/cast
+    @app.route('/movies/<int:movie_id>/cast', methods=['GET'])
+    @requires_auth('get:actors')
+    def retrieve_movie_cast(payload, movie_id):
+        movie = Movie.query.options(selectinload(Movie.cast)).filter(Movie.id == movie_id).one_or_none()
+        if movie is None:
+            abort(404)
+
+        return json_response({
+            'success': True,
+            'movie': movie_id,
+            'cast': actor_serializer.objects(movie.cast)
+        })
+
+    #GET /actors/<actor_id>/movies
+    @app.route('/actors/<int:actor_id>/movies', methods=['GET'])
+    @requires_auth('get:movies')
+    def retrieve_actor_movies(payload, actor_id):
+        actor = Actor.query.options(selectinload(Actor.movies)).filter(Actor.id == actor_id).one_or_none()
+        if actor is None:
+            abort(404)
+
+        return json_response({
+            'success': True,
+            'actor': actor_id,
+            'movies': movie_serializer.objects(actor.movies)
+        })
+
+    #GET /actors/export
+    @app.route('/actors/export', methods=['GET'])
+    @requires_auth('get:actors')
+    def export_actors(payload):
+        return ndjson_export(Actor.query.order_by(Actor.id), get_fields_arg(actor_serializer))
+
+    #GET /movies/export
+    @app.route('/movies/export', methods=['GET'])
+    @requires_auth('get:movies')
+    def export_movies(payload):
+        return ndjson_export(Movie.query.order_by(Movie.id), get_fields_arg(movie_serializer))
+
+    #GET /search
+    @app.route('/search', methods=['GET'])
+    @requires_auth('get:movies')
+    def search_titles_and_names(payload):
+        check_permissions('get:actors', payload)  #results include actors too
+        q = request.args.get('q', '').strip()
+        limit = int_arg('limit', SEARCH_DEFAULT_LIMIT)
+        page = int_arg('page', 1)
+
+        if not SEARCH_MIN_LENGTH <= len(q) <= SEARCH_MAX_LENGTH:
+            abort(422)
+        if not 1 <= limit <= SEARCH_MAX_LIMIT or not 1 <= page <= SEARCH_MAX_PAGE:
+            abort(422)
+
+        try:
+            rows = search(q, limit, page)
+        except Exception as e:
+            app.logger.error(e)
+            abort(422)
+
+        results = []
+        for row in rows[:limit]:
+            addData = {}
+            addData["type"] = row.type
+            addData["id"] = row.id
+            addData["title" if row.type == 'movie' else "name"] = row.text
+            addData["rank"] = float(row.rank)
+            results.append(addData)
+
+        return json_response({
+            'success': True,
+            'results': results,
+            'page': page,
+            'next_page': page + 1 if len(rows) > limit and page < SEARCH_MAX_PAGE else None
+        })
+
+    #GET /stats
+    @app.route('/stats', methods=['GET'])
+    @requires_auth('get:actors')
+    def retrieve_stats(payload):
+        check_permissions('get:movies', payload)
+        try:
+            stats = get_stats()
+        except Exception as e:
+            app.logger.error(e)
+            abort(500)
+
+        return json_response({
+            'success': True,
+            'stats': stats
+        })
+
     #DELETE /actors/ 
     @app.route('/actors/<int:actor_id>', methods=['DELETE'])
     @requires_auth('delete:actors')
     def delete_actor(payload, actor_id):
         try:
-            actor = Actor.query.filter(Actor.id == actor_id).one_or_none()
-
-            if actor is None:
-                abort(404)
-
-            actor.delete()
-              
-            return jsonify({
-                'success': True,
-                'deleted': actor_id
-            })
+            deleted = Actor.delete_by_id(actor_id)  #single DELETE, no SELECT beforehand
 
         except Exception as e:
             app.logger.error(e)
@@ -95,23 +393,21 @@ def create_app(test_config=None):
         finally:
             db.session.close()
 
+        if not deleted:
+            abort(404)
+
+        return jsonify({
+            'success': True,
+            'deleted': actor_id
+        })
+
 
     #DELETE /movies/
     @app.route('/movies/<int:movie_id>', methods=['DELETE'])
     @requires_auth('delete:movies')
     def delete_movie(payload, movie_id):
         try:
-            movie = Movie.query.filter(Movie.id == movie_id).one_or_none()
-
-            if movie is None:
-                abort(404)
-
-            movie.delete()
-              
-            return jsonify({
-                'success': True,
-                'deleted': movie_id
-            })
+            deleted = Movie.delete_by_id(movie_id)  #single DELETE, no SELECT beforehand
 
         except Exception as e:
             app.logger.error(e)
@@ -121,6 +417,14 @@ def create_app(test_config=None):
         finally:
             db.session.close()
 
+        if not deleted:
+            abort(404)
+
+        return jsonify({
+            'success': True,
+            'deleted': movie_id
+        })
+
     #POST /actors 
     @app.route('/actors', methods=['POST'])
     @requires_auth('post:actors')
@@ -130,7 +434,7 @@ def create_app(test_config=None):
         new_age = body.get('age')
         new_gender = body.get('gender')
           
-        if any(field is None or field == "" for field in [new_name, new_age, new_gender]):
+        if missing_fields(body, ACTOR_FIELDS):
             abort(422)
         try:
             actor = Actor(name=new_name, age=new_age, gender=new_gender)
@@ -157,7 +461,11 @@ def create_app(test_config=None):
         new_title = body.get('title') 
         new_releasedate = body.get('releasedate')
           
-        if any(field is None or field == "" for field in [new_title, new_releasedate]):
+        if missing_fields(body, MOVIE_FIELDS):
+            abort(422)
+        try:
+            new_releasedate = parse_movie_values(body)['releasedate']
+        except ValueError:
             abort(422)
         try:
             movie = Movie(title=new_title, releasedate=new_releasedate)
@@ -176,33 +484,258 @@ def create_app(test_config=None):
         finally:
             db.session.close()
 
+    #POST /actors/bulk
+    @app.route('/actors/bulk', methods=['POST'])
+    @requires_auth('post:actors')
+    def bulk_create_actors(payload):
+        records, errors = validate_batch(request.get_json(), ACTOR_FIELDS)
+        if errors:
+            return jsonify({
+                'success': False,
+                'error': 422,
+                'message': 'Unprocessable',
+                'errors': errors
+            }), 422
+        try:
+            created = Actor.bulk_insert(records)
+
+            return jsonify({
+                'success': True,
+                'created': created
+            })
+
+        except Exception as e:
+            app.logger.error(e)
+            db.session.rollback()
+            abort(422)
+
+        finally:
+            db.session.close()
+
+    #POST /movies/bulk
+    @app.route('/movies/bulk', methods=['POST'])
+    @requires_auth('post:movies')
+    def bulk_create_movies(payload):
+        records, errors = validate_batch(request.get_json(), MOVIE_FIELDS, parse_movie_values)
+        if errors:
+            return jsonify({
+                'success': False,
+                'error': 422,
+                'message': 'Unprocessable',
+                'errors': errors
+            }), 422
+        try:
+            created = Movie.bulk_insert(records)
+
+            return jsonify({
+                'success': True,
+                'created': created
+            })
+
+        except Exception as e:
+            app.logger.error(e)
+            db.session.rollback()
+            abort(422)
+
+        finally:
+            db.session.close()
+
+    #PUT /actors/by-key/<key>, idempotent create-or-replace by the client's external key
+    @app.route('/actors/by-key/<key>', methods=['PUT'])
+    @requires_auth('post:actors')
+    def upsert_actor(payload, key):
+        check_permissions('patch:actors', payload)  #an upsert may overwrite an existing actor
+        body = request.get_json()
+        if not valid_external_key(key) or not isinstance(body, dict) or missing_fields(body, ACTOR_FIELDS):
+            abort(422)
+        record = {field: body[field] for field in ACTOR_FIELDS}
+        record['external_key'] = key
+        try:
+            [(actor_id, created)] = Actor.upsert_by_key([record])
+
+        except Exception as e:
+            app.logger.error(e)
+            db.session.rollback()
+            abort(422)
+
+        finally:
+            db.session.close()
+
+        return jsonify({
+            'success': True,
+            'id': actor_id,
+            'created': created
+        }), 201 if created else 200
+
+    #PUT /actors/by-key, the same for a list of records in one statement
+    @app.route('/actors/by-key', methods=['PUT'])
+    @requires_auth('post:actors')
+    def bulk_upsert_actors(payload):
+        check_permissions('patch:actors', payload)
+        body = request.get_json()
+        records, errors = validate_upserts(body, ACTOR_FIELDS)
+        if errors:
+            return jsonify({
+                'success': False,
+                'error': 422,
+                'message': 'Unprocessable',
+                'errors': errors
+            }), 422
+        try:
+            upserted = Actor.upsert_by_key(records)
+
+        except Exception as e:
+            app.logger.error(e)
+            db.session.rollback()
+            abort(422)
+
+        finally:
+            db.session.close()
+
+        return jsonify({
+            'success': True,
+            'results': [{'external_key': record['external_key'], 'id': id, 'created': created}
+                        for record, (id, created) in zip(records, upserted)]
+        })
+
+    #PUT /movies/by-key/<key>, idempotent create-or-replace by the client's external key
+    @app.route('/movies/by-key/<key>', methods=['PUT'])
+    @requires_auth('post:movies')
+    def upsert_movie(payload, key):
+        check_permissions('patch:movies', payload)  #an upsert may overwrite an existing movie
+        body = request.get_json()
+        if not valid_external_key(key) or not isinstance(body, dict) or missing_fields(body, MOVIE_FIELDS):
+            abort(422)
+        record = {field: body[field] for field in MOVIE_FIELDS}
+        record['external_key'] = key
+        try:
+            record = parse_movie_values(record)
+        except ValueError:
+            abort(422)
+        try:
+            [(movie_id, created)] = Movie.upsert_by_key([record])
+
+        except Exception as e:
+            app.logger.error(e)
+            db.session.rollback()
+            abort(422)
+
+        finally:
+            db.session.close()
+
+        return jsonify({
+            'success': True,
+            'id': movie_id,
+            'created': created
+        }), 201 if created else 200
+
+    #PUT /movies/by-key, the same for a list of records in one statement
+    @app.route('/movies/by-key', methods=['PUT'])
+    @requires_auth('post:movies')
+    def bulk_upsert_movies(payload):
+        check_permissions('patch:movies', payload)
+        body = request.get_json()
+        records, errors = validate_upserts(body, MOVIE_FIELDS, parse_movie_values)
+        if errors:
+            return jsonify({
+                'success': False,
+                'error': 422,
+                'message': 'Unprocessable',
+                'errors': errors
+            }), 422
+        try:
+            upserted = Movie.upsert_by_key(records)
+
+        except Exception as e:
+            app.logger.error(e)
+            db.session.rollback()
+            abort(422)
+
+        finally:
+            db.session.close()
+
+        return jsonify({
+            'success': True,
+            'results': [{'external_key': record['external_key'], 'id': id, 'created': created}
+                        for record, (id, created) in zip(records, upserted)]
+        })
+
+    #POST /batch, several creates, updates and deletes in one transaction: all of them are applied or none
+    @app.route('/batch', methods=['POST'])
+    @requires_auth(check=False)  #permissions are checked per operation
+    def batch(payload):
+        body = request.get_json()
+        operations = body.get('operations') if isinstance(body, dict) else None
+        if not isinstance(operations, list) or not operations or len(operations) > MAX_BATCH_OPERATIONS:
+            abort(422)
+
+        parsed = []
+        errors = []
+        for index, operation in enumerate(operations):
+            try:
+                parsed.append(parse_operation(operation))
+            except ValueError as e:
+                errors.append({'index': index, 'message': str(e)})
+        if errors:
+            return jsonify({
+                'success': False,
+                'error': 422,
+                'message': 'Unprocessable',
+                'errors': errors
+            }), 422
+
+        for op, permission, model, record_id, values in parsed:
+            check_permissions(permission, payload)  #every operation is authorised before any of them runs
+
+        results = []
+        failure = None
+        index = 0
+        try:
+            for index, (op, permission, model, record_id, values) in enumerate(parsed):
+                result = run_operation(op, model, record_id, values)
+                if result is None:
+                    failure = {'index': index, 'error': 404, 'message': 'Resource not found'}
+                    break
+                results.append(result)
+            if failure is None:
+                db.session.commit()
+
+        except Exception as e:
+            app.logger.error(e)
+            failure = {'index': index, 'error': 422, 'message': 'Unprocessable'}
+
+        finally:
+            if failure is not None:
+                db.session.rollback()  #undoes the operations that already ran
+            db.session.close()
+
+        if failure is not None:
+            return jsonify({
+                'success': False,
+                'error': failure['error'],
+                'message': failure['message'],
+                'errors': [failure]
+            }), failure['error']
+
+        return jsonify({
+            'success': True,
+            'results': results
+        })
+
     #PATCH /actors/ 
     @app.route('/actors/<int:actor_id>', methods=['PATCH'])
     @requires_auth('patch:actors')
     def update_actor(payload, actor_id):
         body = request.get_json()  #fills in the json user input
-        updated_name = body.get('name') 
-        updated_age = body.get('age')
-        updated_gender = body.get('gender')
+        if not isinstance(body, dict):
+            abort(422)
+        updates = {field: body[field] for field in ACTOR_FIELDS if field in body}  #only the fields that were sent are updated
           
-        if any(field is None or field == "" for field in [updated_name, updated_age, updated_gender]):
+        if not updates or missing_fields(updates, updates):
             abort(422)
 
         try:
-            actor = Actor.query.filter(Actor.id == actor_id).one_or_none()
-
-            if actor is None:
-                abort(404)
-
-            actor.name = updated_name
-            actor.age = updated_age
-            actor.gender = updated_gender
-            actor.update()
-              
-            return jsonify({
-                'success': True,
-                'updated': actor.id
-            })
+            updated = Actor.update_by_id(actor_id, updates)  #single UPDATE, no SELECT beforehand
 
         except Exception as e:
             app.logger.error(e)
@@ -211,31 +744,32 @@ def create_app(test_config=None):
         finally:
             db.session.close()
 
+        if not updated:
+            abort(404)
+
+        return jsonify({
+            'success': True,
+            'updated': actor_id
+        })
+
     #PATCH /movies/ 
     @app.route('/movies/<int:movie_id>', methods=['PATCH'])
     @requires_auth('patch:movies')
     def update_movie(payload, movie_id):
         body = request.get_json()  #fills in the json user input
-        updated_title = body.get('title') 
-        updated_releasedate = body.get('releasedate')
+        if not isinstance(body, dict):
+            abort(422)
+        updates = {field: body[field] for field in MOVIE_FIELDS if field in body}  #only the fields that were sent are updated
           
-        if any(field is None or field == "" for field in [updated_title, updated_releasedate]):
+        if not updates or missing_fields(updates, updates):
             abort(422)
-
         try:
-            movie = Movie.query.filter(Movie.id == movie_id).one_or_none()
-
-            if movie is None:
-                abort(404)
+            updates = parse_movie_values(updates)
+        except ValueError:
+            abort(422)
 
-            movie.title = updated_title
-            movie.releasedate = updated_releasedate
-            movie.update()
-              
-            return jsonify({
-                'success': True,
-                'updated': movie.id
-            })
+        try:
+            updated = Movie.update_by_id(movie_id, updates)  #single UPDATE, no SELECT beforehand
 
         except Exception as e:
             app.logger.error(e)
@@ -244,6 +778,54 @@ def create_app(test_config=None):
         finally:
             db.session.close()
 
+        if not updated:
+            abort(404)
+
+        return jsonify({
+            'success': True,
+            'updated': movie_id
+        })
+
+    #GET /healthz, liveness: the process is up and serving requests
+    @app.route('/healthz', methods=['GET'])
+    def healthz():
+        return jsonify({
+            'success': True
+        })
+
+    #GET /readyz, readiness: the primary database answers and the JWKS is loaded, so the first real request is warm
+    @app.route('/readyz', methods=['GET'])
+    def readyz():
+        checks = {}
+        try:
+            with db.engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+            checks['database'] = 'ok'
+        except Exception as e:
+            app.logger.error(e)
+            checks['database'] = 'unavailable'
+        try:
+            checks['jwks'] = 'ok' if jwks_store.ready() else 'unavailable'
+        except Exception as e:
+            app.logger.error(e)
+            checks['jwks'] = 'unavailable'
+
+        ready = all(status == 'ok' for status in checks.values())
+        return jsonify({
+            'success': ready,
+            'checks': checks
+        }), 200 if ready else 503
+
+    #GET /admin/slow-queries, the most recent slow SQL statements, newest first
+    @app.route('/admin/slow-queries', methods=['GET'])
+    @requires_auth('get:slow-queries')
+    def get_slow_queries(payload):
+        return jsonify({
+            'success': True,
+            'threshold_ms': slow_query.slow_query_log.threshold_ms,
+            'queries': slow_query.slow_query_log.entries()
+        })
+
     @app.route('/login')
     def login():
         print(loginURL)
@@ -300,7 +882,16 @@ def create_app(test_config=None):
 
     return app
 
-app = create_app()
+_app = None
+
+def __getattr__(name):
+    '''creates the module-level app on first access (gunicorn app:app, manage.py), not when app.py is imported'''
+    global _app
+    if name == 'app':
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8080, debug=True)
+    create_app().run(host='0.0.0.0', port=8080, debug=True)
@@ -1,14 +1,27 @@
+import hashlib
 import json
+import logging
 import os
+import threading
+import time
+from collections import OrderedDict
 from flask import request, _request_ctx_stack, abort
 from functools import wraps
-from jose import jwt
 from urllib.request import urlopen
 
+import instrumentation
+
 AUTH0_DOMAIN = os.environ.get('AUTH0_DOMAIN')
 ALGORITHMS = os.environ.get('ALGORITHMS')
 API_AUDIENCE = os.environ.get('API_AUDIENCE')
 
+JWKS_TTL = int(os.environ.get('JWKS_TTL', 600))                                 #seconds before the cached key set is refreshed
+JWKS_MIN_REFRESH_INTERVAL = int(os.environ.get('JWKS_MIN_REFRESH_INTERVAL', 30)) #minimum seconds between two fetches
+JWKS_FETCH_TIMEOUT = int(os.environ.get('JWKS_FETCH_TIMEOUT', 5))
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 1024))                 #verified tokens kept in memory, 0 disables the cache
+
+logger = logging.getLogger(__name__)
+
 # AuthError Exception
 '''
 AuthError Exception
@@ -19,6 +32,199 @@ class AuthError(Exception):
         self.error = error
         self.status_code = status_code
 
+# JWKS key store
+'''
+JWKS fetchers
+Callables returning the parsed JWKS document. The Auth0 fetcher is the default,
+the file fetcher lets tests and offline setups serve a local key set.
+'''
+def auth0_jwks_fetcher():
+    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json', timeout=JWKS_FETCH_TIMEOUT)
+    return json.loads(jsonurl.read())
+
+def file_jwks_fetcher(path):
+    def fetch():
+        with open(path) as jwks_file:
+            return json.load(jwks_file)
+    return fetch
+
+'''
+JWKSStore
+Keeps the parsed public keys by 'kid' so tokens are verified without an outbound
+request. A stale key set keeps being served while it is refreshed in the background,
+an unknown 'kid' triggers one extra refresh, and a failed refresh keeps the last
+good key set. Fetches are single-flight: concurrent callers wait for the fetch in
+progress instead of starting their own.
+'''
+class JWKSStore:
+    def __init__(self, fetcher=auth0_jwks_fetcher, ttl=JWKS_TTL,
+                 min_refresh_interval=JWKS_MIN_REFRESH_INTERVAL, clock=time.monotonic):
+        self.fetcher = fetcher
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.clock = clock
+        self._keys = {}
+        self._fetched_at = None
+        self._last_attempt = None
+        self._attempts = 0
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    @property
+    def kids(self):
+        return set(self._keys)
+
+    def on_rotate(self, listener):
+        '''registers a callable invoked when the set of key IDs changes'''
+        self._listeners.append(listener)
+        return listener
+
+    def get_key(self, kid):
+        if self._fetched_at is None:
+            self.refresh()
+        elif self._refresh_due():
+            self._refresh_in_background()
+
+        key = self._keys.get(kid)
+        if key is None and self._may_refetch():  #unknown kid, the keys may have been rotated
+            self.refresh()
+            key = self._keys.get(kid)
+        return key
+
+    def refresh(self):
+        seen = self._attempts
+        with self._lock:
+            if self._attempts != seen:  #another caller fetched while we were waiting
+                return
+            self._fetch_locked()
+
+    def clear(self):
+        with self._lock:
+            self._keys = {}
+            self._fetched_at = None
+            self._last_attempt = None
+
+    def _may_refetch(self):
+        return self._last_attempt is None or self.clock() - self._last_attempt >= self.min_refresh_interval
+
+    def _refresh_due(self):
+        return self.clock() - self._fetched_at >= self.ttl and self._may_refetch()
+
+    def _refresh_in_background(self):
+        if self._lock.locked():
+            return
+        threading.Thread(target=self._background_refresh, daemon=True).start()
+
+    def _background_refresh(self):
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            if self._refresh_due():
+                self._fetch_locked()
+        except Exception as e:
+            logger.warning('JWKS background refresh failed: %s', e)
+        finally:
+            self._lock.release()
+
+    def _fetch_locked(self):
+        started = time.perf_counter()
+        try:
+            keys = self._parse(self.fetcher())
+        except Exception as e:
+            if not self._keys:
+                raise
+            logger.warning('JWKS refresh failed, serving the last good key set: %s', e)
+            return
+        finally:
+            self._attempts += 1  #counted once the fetch is over so waiting callers can tell it happened
+            self._last_attempt = self.clock()
+            instrumentation.JWKS_FETCH_SECONDS.observe(time.perf_counter() - started)
+
+        rotated = self._fetched_at is not None and set(keys) != set(self._keys)
+        self._keys = keys
+        self._fetched_at = self.clock()
+        if rotated:
+            for listener in self._listeners:
+                listener()
+
+    def ready(self):
+        '''loads the key set if it has not been fetched yet, True once keys are available'''
+        if self._fetched_at is None:
+            self.refresh()
+        return bool(self._keys)
+
+    @staticmethod
+    def _parse(jwks):
+        from jose import jwk  #imported on first use, keeps python-jose and its crypto backend out of startup
+        keys = {}
+        for key in jwks['keys']:
+            if key.get('kty') != 'RSA' or key.get('use', 'sig') != 'sig' or 'kid' not in key:
+                continue
+            try:
+                keys[key['kid']] = jwk.construct(key, key.get('alg', 'RS256'))
+            except Exception as e:
+                logger.warning('Skipping unusable JWKS key %s: %s', key.get('kid'), e)
+        return keys
+
+jwks_store = JWKSStore()
+
+# Verified token cache
+'''
+TokenCache
+Bounded LRU of verified payloads keyed by a SHA-256 digest of the raw token.
+Entries expire at the token's 'exp' claim, tokens without one are never cached.
+'''
+class TokenCache:
+    def __init__(self, maxsize=TOKEN_CACHE_SIZE, clock=time.time):
+        self.maxsize = maxsize
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _digest(token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    def get(self, token):
+        key = self._digest(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.clock() < entry[1]:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:  #expired, the token has to go through full verification again
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, token, payload):
+        expires_at = payload.get('exp')
+        if self.maxsize <= 0 or not isinstance(expires_at, (int, float)):
+            return
+        key = self._digest(token)
+        with self._lock:
+            self._entries[key] = (payload, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries)
+        }
+
+token_cache = TokenCache()
+jwks_store.on_rotate(token_cache.clear)  #payloads verified with a retired key must be verified again
+
 # Auth Header
 
 def get_token_auth_header():
@@ -55,8 +261,7 @@ def get_token_auth_header():
     return token
 
 def verify_decode_jwt(token):   #the input is a JWT token
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')  #collects the public key from Auth0
-    jwks = json.loads(jsonurl.read())                                   #gives us the key/s in a readable dict format, including 'kid'
+    from jose import jwt
     unverified_header = jwt.get_unverified_header(token)                #Uses jwt's get_unverified_header to get the header from the token
     
     if 'kid' not in unverified_header:  #double-checks that the JWT header actually contains a key ID for us to verify
@@ -66,18 +271,10 @@ def verify_decode_jwt(token):   #the input is a JWT token
             'description': 'Authorization malformed.'
         }, 401)  
     
-    rsa_key = {} #empty dictionary to be populated later if the unverified_header key ID matches Auth0's public key ID
-    for key in jwks['keys']:   
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    rsa_key = jwks_store.get_key(unverified_header['kid'])  #parsed public key from the cached Auth0 key set, None if the key ID is unknown
     
     if rsa_key:   #if rsa_key is populated, try to validate/decode the token with the key
+        started = time.perf_counter()
         try:
             payload = jwt.decode(
                 token,
@@ -104,6 +301,8 @@ def verify_decode_jwt(token):   #the input is a JWT token
                 'code': 'invalid_header',
                 'description': 'Unable to parse authentication token.'
             }, 400)
+        finally:
+            instrumentation.JWT_DECODE_SECONDS.observe(time.perf_counter() - started)
     else:
         raise AuthError({
             'code': 'invalid_header',
@@ -124,17 +323,29 @@ def check_permissions(permission, payload):
     return True
 
 
-def requires_auth(permission=''):
+def requires_auth(permission='', check=True):
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
+            started = time.perf_counter()
             token = get_token_auth_header()
+            payload = token_cache.get(token)  #skips signature verification for tokens we have already verified
+            if payload is None:
+                try:
+                    payload = verify_decode_jwt(token)
+                except Exception as e:
+                    logger.info('Token verification failed: %s', e)
+                    abort(401)
+                token_cache.put(token, payload)
+            if check:  #check=False only authenticates, the view must check permissions itself
+                check_permissions(permission, payload)
+
+            route = instrumentation.current_route()
+            authorised = time.perf_counter()
+            instrumentation.AUTH_SECONDS.observe(authorised - started, route=route)
             try:
-                payload = verify_decode_jwt(token)
-            except Exception as e:
-                print(e)
-                abort(401)
-            check_permissions(permission, payload)
-            return f(payload, *args, **kwargs)
+                return f(payload, *args, **kwargs)
+            finally:
+                instrumentation.HANDLER_SECONDS.observe(time.perf_counter() - authorised, route=route)
         return wrapper
     return requires_auth_decorator
\ No newline at end of file
@@ -0,0 +1,356 @@
+import argparse
+import datetime
+import http.client
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import response_cache
+from models import setup_db, db, Actor, Movie
+
+'''
+Benchmark
+Load benchmark for the list, create, patch and delete routes. Every dataset size
+is seeded into a scratch database with that many actors and movies, requests carry
+tokens signed by the local test key (see test_support.py) instead of Auth0 tokens,
+and every endpoint is timed through the in-process WSGI test client and through a
+local gunicorn started with gunicorn.conf.py. Latency percentiles, throughput and
+peak RSS are printed per endpoint and written as JSON so runs can be compared.
+
+    python benchmark.py --size 1000 --size 100000 --requests 500 --output bench.json
+
+BENCHMARK_DATABASE_URL selects the scratch database, a temporary SQLite file per
+size by default. It is dropped and re-created, never point it at real data.
+'''
+BENCHMARK_DATABASE_URL = os.environ.get('BENCHMARK_DATABASE_URL')
+SEED_CHUNK_SIZE = 10000
+DEFAULT_SIZES = (1000,)
+SERVERS = ('wsgi', 'gunicorn')
+GUNICORN_PORT = int(os.environ.get('BENCHMARK_PORT', 8099))
+GUNICORN_STARTUP_TIMEOUT = 60  #seconds to wait for /healthz after starting gunicorn
+GUNICORN_MAIN = 'from gunicorn.app.wsgiapp import run; run()'  #gunicorn 20.0 has no python -m gunicorn
+
+'''
+ENDPOINTS
+name -> (method, path(i, size), body(i)) for the i-th request against a dataset of
+size rows per table. PATCH cycles through the ids from 1 up and DELETE walks
+them down from size, so every request hits an existing row as long as an
+endpoint gets at most size requests (warmup included).
+The list endpoints repeat the same URL, so they run twice: with the response cache,
+where all but the first request are cache hits, and in UNCACHED_ENDPOINTS with
+the cache off, which times the query and the serialisation. They come first, so
+a run restarts gunicorn at most once.
+'''
+ENDPOINTS = {
+    'GET /actors (uncached)': ('GET', lambda i, size: '/actors', None),
+    'GET /movies (uncached)': ('GET', lambda i, size: '/movies', None),
+    'GET /actors (cached)': ('GET', lambda i, size: '/actors', None),
+    'GET /movies (cached)': ('GET', lambda i, size: '/movies', None),
+    'POST /actors': ('POST', lambda i, size: '/actors',
+                     lambda i: {'name': f'Bench Actor {i}', 'age': 20 + i % 60, 'gender': 'Female'}),
+    'POST /movies': ('POST', lambda i, size: '/movies',
+                     lambda i: {'title': f'Bench Movie {i}', 'releasedate': '2024-01-31'}),
+    'PATCH /actors/<id>': ('PATCH', lambda i, size: f'/actors/{1 + i % size}', lambda i: {'age': 20 + i % 60}),
+    'PATCH /movies/<id>': ('PATCH', lambda i, size: f'/movies/{1 + i % size}', lambda i: {'title': f'Bench Movie {i}'}),
+    'DELETE /actors/<id>': ('DELETE', lambda i, size: f'/actors/{size - i}', None),
+    'DELETE /movies/<id>': ('DELETE', lambda i, size: f'/movies/{size - i}', None)
+}
+UNCACHED_ENDPOINTS = ('GET /actors (uncached)', 'GET /movies (uncached)')
+
+def percentile(sorted_values, p):
+    '''nearest-rank percentile of an ascending list, None when it is empty'''
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * p // 100))  #ceil(n * p / 100), at least the first value
+    return sorted_values[int(rank) - 1]
+
+def summarize(latencies, elapsed, errors):
+    '''request latencies in seconds and the wall time they took -> result fields in milliseconds'''
+    latencies = sorted(latencies)
+    ms = lambda value: None if value is None else round(value * 1000, 3)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p95_ms': ms(percentile(latencies, 95)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'mean_ms': ms(sum(latencies) / len(latencies)) if latencies else None,
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed > 0 else None
+    }
+
+'''
+Peak RSS
+The WSGI client runs in this process, so its peak is ru_maxrss. For gunicorn it is
+the sum of VmHWM over the master and its workers, read from /proc (Linux only,
+None elsewhere). Both are high-water marks, an endpoint reports the peak reached
+by the time it finished.
+'''
+def self_peak_rss():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  #bytes on macOS, kilobytes on Linux
+
+def _vm_hwm(pid):
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def _children(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as children:
+            return [int(child) for child in children.read().split()]
+    except OSError:
+        return []
+
+def process_tree_peak_rss(pid):
+    peaks = [_vm_hwm(process) for process in [pid] + _children(pid)]
+    peaks = [peak for peak in peaks if peak is not None]
+    return sum(peaks) if peaks else None
+
+def database_url(size, directory):
+    return BENCHMARK_DATABASE_URL or f"sqlite:///{os.path.join(directory, f'bench-{size}.db')}"
+
+def seed(size):
+    '''re-creates the schema with size actors and size movies, inserted in chunks'''
+    db.drop_all()
+    db.create_all()
+    for start in range(0, size, SEED_CHUNK_SIZE):
+        stop = min(start + SEED_CHUNK_SIZE, size)
+        db.session.execute(Actor.__table__.insert(), [
+            {'name': f'Actor {i}', 'age': 18 + i % 70, 'gender': 'Male' if i % 2 else 'Female'}
+            for i in range(start, stop)
+        ])
+        db.session.execute(Movie.__table__.insert(), [
+            {'title': f'Movie {i}', 'releasedate': datetime.date(1950 + i % 75, 1 + i % 12, 1 + i % 28)}
+            for i in range(start, stop)
+        ])
+        db.session.commit()
+    db.session.remove()
+
+def server_app():
+    '''gunicorn entry point, the app with the JWKS the benchmark process signs with: gunicorn 'benchmark:server_app()\''''
+    import test_support
+    from app import create_app
+    test_support.install_jwks_stub(json.loads(os.environ['BENCHMARK_JWKS']))
+    return create_app()
+
+class WSGIClient:
+    '''drives the app in this process through the Flask test client, one request at a time'''
+    concurrency = 1
+
+    def __init__(self, app, token, cached=True):
+        self.client = app.test_client()
+        self.headers = {'Authorization': f'Bearer {token}'}
+        self.cached = cached
+        self._backend = response_cache.backend
+        if not cached:
+            response_cache.backend = None  #what RESPONSE_CACHE_BACKEND=none sets up
+
+    def request(self, method, path, body):
+        return self.client.open(path, method=method, json=body, headers=self.headers).status_code
+
+    def peak_rss(self):
+        return self_peak_rss()
+
+    def close(self):
+        response_cache.backend = self._backend
+
+class GunicornClient:
+    '''starts gunicorn -c gunicorn.conf.py on a local port and drives it over keep-alive HTTP connections'''
+    def __init__(self, url, token, concurrency, cached=True, port=GUNICORN_PORT):
+        import test_support
+        self.port = port
+        self.concurrency = concurrency
+        self.cached = cached
+        self.headers = {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}
+        self._local = threading.local()
+        env = dict(
+            os.environ,
+            PORT=str(port),
+            DATABASE_URL=url,
+            DATABASE_REPLICA_URLS='',
+            BENCHMARK_JWKS=json.dumps(test_support.JWKS),
+            GUNICORN_MAX_REQUESTS='0',  #recycled workers would reset the RSS peaks
+            RESPONSE_CACHE_BACKEND=os.environ.get('RESPONSE_CACHE_BACKEND', 'memory') if cached else 'none'
+        )
+        directory = os.path.dirname(os.path.abspath(__file__))
+        self.process = subprocess.Popen(
+            [sys.executable, '-c', GUNICORN_MAIN, '-c', 'gunicorn.conf.py', 'benchmark:server_app()'],
+            cwd=directory, env=env
+        )
+        self._wait_until_ready()
+
+    def _wait_until_ready(self):
+        deadline = time.monotonic() + GUNICORN_STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'gunicorn exited with status {self.process.returncode}')
+            try:
+                connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=1)
+                connection.request('GET', '/healthz')
+                if connection.getresponse().status == 200:
+                    return
+            except OSError:
+                pass
+            time.sleep(0.2)
+        self.close()
+        raise RuntimeError(f'gunicorn did not answer on port {self.port} within {GUNICORN_STARTUP_TIMEOUT}s')
+
+    def request(self, method, path, body):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection('127.0.0.1', self.port)
+        try:
+            connection.request(method, path, body=None if body is None else json.dumps(body), headers=self.headers)
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            self._local.connection = None
+            raise
+
+    def peak_rss(self):
+        return process_tree_peak_rss(self.process.pid)
+
+    def close(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+'''
+run_endpoint(client, endpoint, size, requests, warmup)
+    sends warmup untimed requests, then requests timed ones, spread over
+    client.concurrency threads. Responses other than 2xx/304 and failed connections
+    count as errors; their latencies are still recorded.
+'''
+def run_endpoint(client, endpoint, size, requests, warmup):
+    method, path, body = ENDPOINTS[endpoint]
+
+    def send(i):
+        started = time.perf_counter()
+        try:
+            status = client.request(method, path(i, size), body(i) if body else None)
+            ok = 200 <= status < 300 or status == 304
+        except (OSError, http.client.HTTPException):
+            ok = False
+        return time.perf_counter() - started, ok
+
+    for i in range(warmup):
+        send(i)
+    started = time.perf_counter()
+    if client.concurrency > 1:
+        with ThreadPoolExecutor(client.concurrency) as pool:
+            outcomes = list(pool.map(send, range(warmup, warmup + requests)))
+    else:
+        outcomes = [send(i) for i in range(warmup, warmup + requests)]
+    elapsed = time.perf_counter() - started
+    result = summarize([latency for latency, ok in outcomes], elapsed, sum(1 for latency, ok in outcomes if not ok))
+    result['peak_rss_bytes'] = client.peak_rss()
+    return result
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(sizes, servers, endpoints, requests, warmup, concurrency, output=None):
+    '''runs every endpoint on every server for every dataset size, returns the report and writes it to output'''
+    import test_support
+    from app import create_app
+
+    endpoints = [endpoint for endpoint in ENDPOINTS if endpoint in endpoints]  #uncached ones first, see ENDPOINTS
+    token = test_support.make_token(expires_in=24 * 3600)
+    test_support.install_jwks_stub()
+    directory = tempfile.mkdtemp(prefix='castingagency-bench-')
+    report = {
+        'started_at': datetime.datetime.utcnow().isoformat() + 'Z',
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {
+            'sizes': list(sizes), 'servers': list(servers), 'requests': requests, 'warmup': warmup,
+            'concurrency': concurrency, 'gunicorn_workers': os.environ.get('WEB_CONCURRENCY', '2')
+        },
+        'results': []
+    }
+    try:
+        for size in sizes:
+            per_endpoint = min(requests, max(1, size - warmup))  #see ENDPOINTS
+            url = database_url(size, directory)
+            for server in servers:
+                app = create_app()
+                setup_db(app, url, [])
+                with app.app_context():
+                    seed(size)  #fresh data for each server, the writes of the previous run are gone
+                    database = db.engine.dialect.name
+                    db.engine.dispose()  #the gunicorn workers use their own connections
+                client = None
+                try:
+                    for endpoint in endpoints:
+                        cached = endpoint not in UNCACHED_ENDPOINTS
+                        if client is None or client.cached != cached:
+                            if client is not None:
+                                client.close()
+                            client = (WSGIClient(app, token, cached) if server == 'wsgi'
+                                      else GunicornClient(url, token, concurrency, cached))
+                        result = run_endpoint(client, endpoint, size, per_endpoint, warmup)
+                        result.update(server=server, size=size, database=database, endpoint=endpoint,
+                                      response_cache=cached)
+                        report['results'].append(result)
+                        print(format_result(result), flush=True)
+                finally:
+                    if client is not None:
+                        client.close()
+    finally:
+        shutil.rmtree(directory, True)
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+def format_result(result):
+    rss = result['peak_rss_bytes']
+    return '{server:<8} {size:>8} {endpoint:<24} p50 {p50_ms:>8} ms  p95 {p95_ms:>8} ms  p99 {p99_ms:>8} ms  {throughput_rps:>8} req/s  errors {errors}  peak RSS {rss}'.format(
+        rss=f'{rss / 2 ** 20:.1f} MiB' if rss else 'n/a', **result)
+
+def parse_size(value):
+    '''1000, 100k, 1M'''
+    multipliers = {'k': 1000, 'm': 1000000}
+    suffix = value[-1:].lower()
+    if suffix in multipliers:
+        return int(value[:-1]) * multipliers[suffix]
+    return int(value)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the API endpoints.')
+    parser.add_argument('--size', type=parse_size, action='append', help='actors and movies to seed, e.g. 1k, 100k, 1M (repeatable)')
+    parser.add_argument('--server', choices=SERVERS, action='append', help='wsgi, gunicorn or both (repeatable, default both)')
+    parser.add_argument('--endpoint', choices=list(ENDPOINTS), action='append', help='endpoints to run (repeatable, default all)')
+    parser.add_argument('--requests', type=int, default=200, help='timed requests per endpoint')
+    parser.add_argument('--warmup', type=int, default=10, help='untimed requests per endpoint before timing')
+    parser.add_argument('--concurrency', type=int, default=4, help='client threads against gunicorn')
+    parser.add_argument('--output', help='file to write the JSON report to')
+    args = parser.parse_args(argv)
+    run(args.size or DEFAULT_SIZES, args.server or SERVERS, args.endpoint or list(ENDPOINTS),
+        args.requests, args.warmup, args.concurrency, args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+RESPONSE_CACHE_BACKEND = os.environ.get('RESPONSE_CACHE_BACKEND', 'memory')  #memory, file or none
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 1024))         #entries kept per worker (memory) or per host (file)
+RESPONSE_CACHE_DIR = os.environ.get('RESPONSE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'castingagency-cache'))
+
+'''
+TTLCache
+Small in-process cache whose entries expire ttl seconds after they are set.
+A ttl of 0 disables it. Each gunicorn worker keeps its own copy.
+'''
+class TTLCache:
+    def __init__(self, ttl, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self.clock() >= entry[1]:
+                del self._entries[key]
+                return None
+            return entry[0]
+
+    def set(self, key, value):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, self.clock() + self.ttl)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+'''
+Response cache backends
+A backend stores bytes under (namespace, key) and must provide get, set,
+namespaces, clear_namespace and clear. LRUBackend is bounded and private to the
+worker; FileBackend keeps one directory per namespace so every worker on a host
+shares it (and doubles as a stand-in for a networked store in tests). Both keep
+at most maxsize entries and evict the least recently used, since junk query
+parameters make every request a new key.
+'''
+class LRUBackend:
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, namespace, key):
+        with self._lock:
+            value = self._entries.get((namespace, key))
+            if value is not None:
+                self._entries.move_to_end((namespace, key))
+            return value
+
+    def set(self, namespace, key, value):
+        with self._lock:
+            self._entries[(namespace, key)] = value
+            self._entries.move_to_end((namespace, key))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def namespaces(self):
+        with self._lock:
+            return {namespace for namespace, key in self._entries}
+
+    def clear_namespace(self, namespace):
+        with self._lock:
+            for entry in [entry for entry in self._entries if entry[0] == namespace]:
+                del self._entries[entry]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class FileBackend:
+    def __init__(self, directory, maxsize=1024):
+        self.directory = directory
+        self.maxsize = maxsize
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, namespace, key):
+        return os.path.join(self.directory, namespace, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, namespace, key):
+        path = self._path(namespace, key)
+        try:
+            with open(path, 'rb') as cache_file:
+                value = cache_file.read()
+            os.utime(path)  #the modification time orders the eviction, a hit makes the entry recent
+            return value
+        except OSError:
+            return None
+
+    def set(self, namespace, key, value):
+        path = self._path(namespace, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as cache_file:
+            cache_file.write(value)
+        os.replace(tmp_path, path)  #readers never see a partially written entry
+        self._evict()
+
+    def _entries(self):
+        for namespace in self.namespaces():
+            directory = os.path.join(self.directory, namespace)
+            for name in os.listdir(directory):
+                yield os.path.join(directory, name)
+
+    def _evict(self):
+        entries = []
+        for path in self._entries():
+            try:
+                entries.append((os.stat(path).st_mtime_ns, path))
+            except OSError:  #removed by another worker meanwhile
+                pass
+        if len(entries) <= self.maxsize:
+            return
+        entries.sort()
+        for mtime, path in entries[:len(entries) - self.maxsize]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def namespaces(self):
+        return {entry for entry in os.listdir(self.directory) if os.path.isdir(os.path.join(self.directory, entry))}
+
+    def clear_namespace(self, namespace):
+        shutil.rmtree(os.path.join(self.directory, namespace), ignore_errors=True)
+
+    def clear(self):
+        for namespace in self.namespaces():
+            self.clear_namespace(namespace)
+
+    def __len__(self):
+        return sum(1 for path in self._entries())
+
+'''
+ResponseCache
+Serialised list responses, namespaced by the tables they are built from
+(e.g. 'movies.actors') and keyed by endpoint and ETag. The ETag already carries
+the table versions, so an entry can never outlive a write; invalidate() drops
+the superseded entries eagerly and is called by models.bump_version.
+'''
+class ResponseCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, tables, key):
+        value = self.backend.get('.'.join(tables), key) if self.backend is not None else None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, tables, key, value):
+        if self.backend is not None:
+            self.backend.set('.'.join(tables), key, value)
+
+    def invalidate(self, table):
+        if self.backend is None:
+            return
+        for namespace in self.backend.namespaces():
+            if table in namespace.split('.'):
+                self.backend.clear_namespace(namespace)
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self.backend) if self.backend is not None else 0
+        }
+
+def make_backend(kind=RESPONSE_CACHE_BACKEND):
+    if kind == 'memory':
+        return LRUBackend(RESPONSE_CACHE_SIZE)
+    if kind == 'file':
+        return FileBackend(RESPONSE_CACHE_DIR, RESPONSE_CACHE_SIZE)
+    if kind == 'none':
+        return None
+    raise ValueError(f'Unknown RESPONSE_CACHE_BACKEND: {kind}')
+
+response_cache = ResponseCache(make_backend())
@@ -0,0 +1,234 @@
+import csv
+import datetime
+import io
+import itertools
+import json
+import os
+import random
+
+from models import db, Actor, Movie, castings, bump_version
+
+'''
+Data loading
+Bulk loaders behind the manage.py generate and import commands. Rows are streamed
+through in chunks of LOAD_CHUNK_SIZE, so memory stays flat however many there are.
+PostgreSQL receives every chunk with COPY ... FROM STDIN, other backends (SQLite)
+with one batched executemany INSERT per chunk. A load runs in one transaction
+together with the table version bumps, so it is all or nothing and cached list
+responses are invalidated when it commits.
+'''
+LOAD_CHUNK_SIZE = int(os.environ.get('LOAD_CHUNK_SIZE', 10000))
+
+ACTOR_COLUMNS = ('name', 'age', 'gender', 'external_key')
+MOVIE_COLUMNS = ('title', 'releasedate', 'external_key')
+CASTING_COLUMNS = ('movie_id', 'actor_id')
+
+FIRST_NAMES = (
+    'James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+    'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Carlos', 'Karen',
+    'Wei', 'Yuki', 'Amara', 'Ravi', 'Sofia', 'Mateo', 'Aisha', 'Lars', 'Ingrid', 'Kofi'
+)
+LAST_NAMES = (
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+    'Hernandez', 'Lopez', 'Wilson', 'Anderson', 'Taylor', 'Moore', 'Jackson', 'Martin', 'Lee', 'Thompson',
+    'Chen', 'Tanaka', 'Okafor', 'Patel', 'Rossi', 'Silva', 'Khan', 'Larsen', 'Nilsson', 'Mensah'
+)
+TITLE_WORDS = (
+    'Midnight', 'Silent', 'Golden', 'Broken', 'Last', 'Hidden', 'Crimson', 'Distant', 'Frozen', 'Electric',
+    'River', 'Empire', 'Garden', 'Shadow', 'Harbor', 'Summer', 'Signal', 'Kingdom', 'Storm', 'Horizon'
+)
+GENDERS = ('Female', 'Male')
+FIRST_RELEASE = datetime.date(1920, 1, 1)
+LAST_RELEASE = datetime.date(2030, 12, 31)
+
+'''
+Synthetic data
+Generators of column dicts, reproducible for a given seed. Generated rows have no
+external_key, so they never collide with rows imported or upserted by key.
+'''
+def generate_actors(count, seed=0):
+    rng = random.Random(f'actors-{seed}')
+    for _ in range(count):
+        yield {
+            'name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+            'age': rng.randint(18, 90),
+            'gender': rng.choice(GENDERS),
+            'external_key': None
+        }
+
+def generate_movies(count, seed=0):
+    rng = random.Random(f'movies-{seed}')
+    days = (LAST_RELEASE - FIRST_RELEASE).days
+    for _ in range(count):
+        yield {
+            'title': f'The {rng.choice(TITLE_WORDS)} {rng.choice(TITLE_WORDS)}',
+            'releasedate': FIRST_RELEASE + datetime.timedelta(days=rng.randint(0, days)),
+            'external_key': None
+        }
+
+def generate_castings(movie_ids, actor_ids, per_movie, seed=0):
+    '''up to per_movie distinct actors from the range actor_ids for every movie in the range movie_ids'''
+    rng = random.Random(f'castings-{seed}')
+    for movie_id in movie_ids:
+        for actor_id in rng.sample(actor_ids, min(rng.randint(1, per_movie), len(actor_ids))):
+            yield {'movie_id': movie_id, 'actor_id': actor_id}
+
+def chunks(rows, size=LOAD_CHUNK_SIZE):
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _copy_chunk(cursor, table, columns, chunk):
+    '''one COPY ... FROM STDIN of chunk as CSV, where an unquoted empty field is NULL'''
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in chunk:
+        writer.writerow(['' if row[column] is None else row[column] for column in columns])
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+def insert_rows(table, columns, rows, chunk_size=LOAD_CHUNK_SIZE):
+    '''streams rows (dicts with at least columns) into table in chunks, returns how many; does not commit'''
+    connection = db.session.connection()
+    postgres = connection.dialect.name == 'postgresql'
+    count = 0
+    for chunk in chunks(rows, chunk_size):
+        if postgres:
+            cursor = connection.connection.cursor()
+            try:
+                _copy_chunk(cursor, table, columns, chunk)
+            finally:
+                cursor.close()
+        else:
+            connection.execute(table.insert(), [{column: row[column] for column in columns} for row in chunk])
+        count += len(chunk)
+    return count
+
+'''
+load_rows(table, columns, rows, version)
+    streams rows (dicts with at least columns) into table in chunks and returns how
+    many were loaded. version names the table version to bump, table's own by default.
+    Commits once at the end; on any error the whole load is rolled back.
+'''
+def load_rows(table, columns, rows, chunk_size=LOAD_CHUNK_SIZE, version=None):
+    db.session().use_primary()  #manage.py runs inside a GET test request context
+    try:
+        count = insert_rows(table, columns, rows, chunk_size)
+        bump_version(version or table.name)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return count
+
+def max_id(model):
+    return db.session.query(db.func.max(model.id)).scalar() or 0
+
+def ids_after(model, after):
+    '''ids of model above after, in order. Read back, not computed: a sequence skips the ids of rolled-back inserts'''
+    return [id for id, in db.session.query(model.id).filter(model.id > after).order_by(model.id)]
+
+def lock_for_load(*models):
+    '''on PostgreSQL, keeps other writers out of the tables until the load commits, reads go on'''
+    if db.session.connection().dialect.name == 'postgresql':
+        names = ', '.join(model.__tablename__ for model in models)
+        db.session.execute(f'LOCK TABLE {names} IN SHARE ROW EXCLUSIVE MODE')
+
+'''
+generate(actors, movies, castings_per_movie, seed)
+    appends synthetic actors and movies, then links every new movie to up to
+    castings_per_movie of the new actors. Returns the number of rows per table.
+    All three tables are loaded in one transaction, so a failure loads nothing.
+'''
+def generate(actors, movies, castings_per_movie=0, seed=0, chunk_size=LOAD_CHUNK_SIZE):
+    db.session().use_primary()
+    try:
+        lock_for_load(Actor, Movie)  #before max_id, so only this load adds ids above it
+        last_actor, last_movie = max_id(Actor), max_id(Movie)
+        loaded = {
+            'actors': insert_rows(Actor.__table__, ACTOR_COLUMNS, generate_actors(actors, seed), chunk_size),
+            'movies': insert_rows(Movie.__table__, MOVIE_COLUMNS, generate_movies(movies, seed), chunk_size),
+            'castings': 0
+        }
+        if castings_per_movie and actors and movies:
+            actor_ids, movie_ids = ids_after(Actor, last_actor), ids_after(Movie, last_movie)
+            loaded['castings'] = insert_rows(castings, CASTING_COLUMNS,
+                                             generate_castings(movie_ids, actor_ids, castings_per_movie, seed),
+                                             chunk_size)
+        bump_version('actors')
+        bump_version('movies')  #casts are cached with the movies
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return loaded
+
+'''
+File import
+CSV files need a header row naming the columns; NDJSON files hold one JSON object
+per line. Columns other than those of the resource are ignored, external_key is
+optional. Rows are checked as they are read and the first invalid one aborts the
+import with a ValueError naming its line.
+'''
+def parse_actor(record):
+    return {
+        'name': _required(record, 'name'),
+        'age': int(_required(record, 'age')),
+        'gender': _required(record, 'gender'),
+        'external_key': record.get('external_key') or None
+    }
+
+def parse_movie(record):
+    return {
+        'title': _required(record, 'title'),
+        'releasedate': datetime.date.fromisoformat(_required(record, 'releasedate')),
+        'external_key': record.get('external_key') or None
+    }
+
+IMPORTS = {
+    'actors': (Actor.__table__, ACTOR_COLUMNS, parse_actor),
+    'movies': (Movie.__table__, MOVIE_COLUMNS, parse_movie)
+}
+
+def _required(record, field):
+    value = record.get(field)
+    if value is None or value == '':
+        raise ValueError(f'{field} is missing')
+    return value
+
+def read_records(file, format):
+    '''(line number, record dict) for every record of a csv or ndjson file, read lazily'''
+    if format == 'csv':
+        reader = csv.DictReader(file)
+        for record in reader:
+            yield reader.line_num, record
+    elif format == 'ndjson':
+        for number, line in enumerate(file, 1):
+            if line.strip():
+                try:
+                    yield number, json.loads(line)
+                except ValueError as e:
+                    raise ValueError(f'line {number}: {e}') from e
+    else:
+        raise ValueError(f'unknown format {format!r}, expected csv or ndjson')
+
+def file_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    return {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}.get(extension)
+
+def parse_records(records, parse):
+    for number, record in records:
+        try:
+            yield parse(record)
+        except (AttributeError, TypeError, ValueError) as e:
+            raise ValueError(f'line {number}: {e}') from e
+
+def import_file(path, resource, format=None, chunk_size=LOAD_CHUNK_SIZE):
+    '''loads the actors or movies of a CSV or NDJSON file and returns how many there were'''
+    table, columns, parse = IMPORTS[resource]
+    format = format or file_format(path)
+    with open(path, newline='', encoding='utf-8') as file:
+        return load_rows(table, columns, parse_records(read_records(file, format), parse), chunk_size)
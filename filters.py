@@ -0,0 +1,57 @@
+import datetime
+from flask import abort
+
+from models import Movie, Actor
+
+'''
+List filters
+Translate the query string of GET /actors and GET /movies into WHERE clauses,
+so filtering happens in SQL on the indexed columns. Invalid values abort with 422.
+'''
+def _int_arg(args, name):
+    value = args.get(name)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        abort(422)
+
+def _date_arg(args, name):
+    value = args.get(name)
+    if value is None:
+        return None
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        abort(422)
+
+def _like_prefix(value):
+    escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return escaped + '%'
+
+def filter_actors(query, args):
+    gender = args.get('gender')
+    min_age = _int_arg(args, 'min_age')
+    max_age = _int_arg(args, 'max_age')
+
+    if gender:
+        query = query.filter(Actor.gender == gender)
+    if min_age is not None:
+        query = query.filter(Actor.age >= min_age)
+    if max_age is not None:
+        query = query.filter(Actor.age <= max_age)
+    return query
+
+def filter_movies(query, args):
+    released_after = _date_arg(args, 'released_after')
+    released_before = _date_arg(args, 'released_before')
+    title = args.get('title')
+
+    if released_after is not None:
+        query = query.filter(Movie.releasedate >= released_after)
+    if released_before is not None:
+        query = query.filter(Movie.releasedate <= released_before)
+    if title:
+        query = query.filter(Movie.title.like(_like_prefix(title), escape='\\'))  #prefix match
+    return query
@@ -0,0 +1,27 @@
+import os
+
+#gunicorn settings, used by the Procfile: gunicorn -c gunicorn.conf.py app:app
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() in ('1', 'true', 'yes')  #import the app once in the master, workers share its memory
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))                           #recycle workers after this many requests, 0 never
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 0))              #spreads the restarts so workers do not reconnect at once
+
+'''
+Connections and fork
+create_app() does not connect, engines open connections on first use. Should
+anything in a preloaded master touch the database anyway, the master closes its
+connections before any worker is forked, and each worker disposes its engine again
+so it starts with a pool of its own.
+'''
+def when_ready(server):
+    if preload_app:
+        from models import dispose_engine
+        dispose_engine()
+
+def post_fork(server, worker):
+    if preload_app:
+        from models import dispose_engine
+        dispose_engine()
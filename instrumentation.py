@@ -0,0 +1,236 @@
+import hmac
+import os
+import threading
+import time
+from bisect import bisect_left
+from flask import Response, g, has_request_context, request, abort
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  #when set, /metrics requires "Authorization: Bearer <METRICS_TOKEN>"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+'''
+Metrics
+Minimal in-process Prometheus metrics: counters and histograms keyed by label
+values, plus callback metrics read at scrape time. Updates take one lock and a
+bisect, so the instrumentation can stay on in production. Each gunicorn worker
+keeps its own registry.
+'''
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for name, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            counts[0][index] += 1
+            counts[1] += value
+            counts[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts[0]), counts[1], counts[2]) for key, counts in self._values.items()}
+        for key, (bucket_counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), bucket_counts):
+                cumulative += bucket_count
+                le = bound if bound == '+Inf' else _format_value(float(bound))
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', le)])} {cumulative}"
+            yield f'{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}'
+            yield f'{self.name}_count{_format_labels(self.labelnames, key)} {count}'
+
+class CallbackMetric:
+    '''a counter or gauge whose value is read from callback() at scrape time'''
+    def __init__(self, name, help, type, callback):
+        self.name = name
+        self.help = help
+        self.type = type
+        self.callback = callback
+
+    def samples(self):
+        yield f'{self.name} {_format_value(self.callback())}'
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric  #re-registering a name replaces it, create_app may run more than once
+        return metric
+
+    def render(self):
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f'# HELP {name} {metric.help}')
+            lines.append(f'# TYPE {name} {metric.type}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.register(Histogram(
+    'http_request_duration_seconds', 'Request latency by route.', ('route', 'method', 'status')))
+AUTH_SECONDS = registry.register(Histogram(
+    'auth_duration_seconds', 'Time spent authenticating and authorising a request.', ('route',)))
+HANDLER_SECONDS = registry.register(Histogram(
+    'handler_duration_seconds', 'Time spent in the view once the request is authorised.', ('route',)))
+JWKS_FETCH_SECONDS = registry.register(Histogram(
+    'jwks_fetch_duration_seconds', 'Time spent fetching and parsing the JWKS.'))
+JWT_DECODE_SECONDS = registry.register(Histogram(
+    'jwt_decode_duration_seconds', 'Time spent verifying a JWT signature and claims.'))
+DB_QUERY_SECONDS = registry.register(Histogram(
+    'db_query_duration_seconds', 'Duration of individual SQL statements.'))
+DB_QUERIES_PER_REQUEST = registry.register(Histogram(
+    'db_queries_per_request', 'Number of SQL statements issued by a request.', ('route',), QUERY_COUNT_BUCKETS))
+DB_SECONDS_PER_REQUEST = registry.register(Histogram(
+    'db_duration_per_request_seconds', 'Total SQL time of a request.', ('route',)))
+POOL_WAIT_SECONDS = registry.register(Histogram(
+    'db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled connection.'))
+DB_REPLICA_UNAVAILABLE = registry.register(Counter(
+    'db_replica_unavailable_total', 'Failed read replica health checks, reads fell back to the primary.'))
+DB_SLOW_QUERIES = registry.register(Counter(
+    'db_slow_queries_total', 'SQL statements slower than SLOW_QUERY_THRESHOLD_MS.'))
+
+def register_cache_stats(prefix, cache):
+    '''exports hits, misses and size of any cache with a stats() method'''
+    registry.register(CallbackMetric(f'{prefix}_hits_total', f'{prefix} lookups served from the cache.', 'counter',
+                                     lambda: cache.stats()['hits']))
+    registry.register(CallbackMetric(f'{prefix}_misses_total', f'{prefix} lookups that missed.', 'counter',
+                                     lambda: cache.stats()['misses']))
+    registry.register(CallbackMetric(f'{prefix}_size', f'Entries currently held by {prefix}.', 'gauge',
+                                     lambda: cache.stats()['size']))
+
+def current_route():
+    if has_request_context() and request.url_rule is not None:
+        return request.url_rule.rule
+    return 'unmatched'
+
+'''
+TimedQueuePool
+QueuePool that records how long each checkout waited for a connection. SQLAlchemy
+has no event before a checkout, so the wait is measured around _do_get; being a
+subclass it survives engine.dispose(), which recreates the pool from its class.
+'''
+class TimedQueuePool(QueuePool):
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+
+'''
+SQL statement timing
+Listeners on the Engine class, so they cover every engine the app creates.
+Per-request totals are accumulated on flask.g and published when the request ends.
+A request that sets g.sql_statements to a list (a profiled one) also gets every
+statement with its time appended to it. Functions in statement_observers are
+called with (conn, statement, parameters, elapsed, executemany) after every
+statement, so other modules can use its time without timing it again. A statement
+that raises never reaches after_cursor_execute; handle_error drops its start time.
+'''
+statement_observers = []
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append((context, time.perf_counter()))
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()[1]
+    DB_QUERY_SECONDS.observe(elapsed)
+    if has_request_context():
+        if 'db_queries' in g:
+            g.db_queries += 1
+            g.db_seconds += elapsed
+        if 'sql_statements' in g:
+            g.sql_statements.append((statement, elapsed))
+    for observer in statement_observers:
+        observer(conn, statement, parameters, elapsed, executemany)
+
+def _handle_error(context):
+    if context.connection is None:  #the connect itself failed
+        return
+    started = context.connection.info.get('query_started')
+    if started and started[-1][0] is context.execution_context:  #errors before the cursor ran pushed nothing
+        started.pop()
+
+def install_sql_listeners():
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+
+'''
+init_app(app)
+    times every request, publishes its SQL totals and serves /metrics.
+'''
+def init_app(app):
+    install_sql_listeners()
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        g.db_queries = 0
+        g.db_seconds = 0.0
+
+    @app.after_request
+    def record_request_metrics(response):
+        if 'request_started' in g:
+            route = current_route()
+            REQUEST_SECONDS.observe(time.perf_counter() - g.request_started,
+                                    route=route, method=request.method, status=response.status_code)
+            DB_QUERIES_PER_REQUEST.observe(g.db_queries, route=route)
+            DB_SECONDS_PER_REQUEST.observe(g.db_seconds, route=route)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        if METRICS_TOKEN and not hmac.compare_digest(request.headers.get('Authorization', '').encode('utf-8'),
+                                                     f'Bearer {METRICS_TOKEN}'.encode('utf-8')):  #constant time, bytes take non-ASCII too
+            abort(401)
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
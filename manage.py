@@ -3,12 +3,51 @@ from flask_migrate import Migrate, MigrateCommand
 
 from app import app
 from models import db
+import dataload
+import profiling
 
 migrate = Migrate(app, db)
 manager = Manager(app)
 
 manager.add_command('db', MigrateCommand)
 
+#python3 manage.py generate --actors 1000000 --movies 1000000 --castings 5
+@manager.option('--actors', dest='actors', type=int, default=1000, help='synthetic actors to add')
+@manager.option('--movies', dest='movies', type=int, default=1000, help='synthetic movies to add')
+@manager.option('--castings', dest='castings', type=int, default=0, help='link every new movie to up to this many new actors')
+@manager.option('--seed', dest='seed', type=int, default=0, help='same seed, same data')
+@manager.option('--chunk-size', dest='chunk_size', type=int, default=dataload.LOAD_CHUNK_SIZE, help='rows per COPY or INSERT batch')
+def generate(actors, movies, castings, seed, chunk_size):
+    '''adds synthetic actors, movies and castings in bulk'''
+    loaded = dataload.generate(actors, movies, castings, seed, chunk_size)
+    print(', '.join(f'{count} {table}' for table, count in loaded.items()) + ' loaded')
+
+#python3 manage.py import_data actors actors.csv
+@manager.option('path', help='.csv file with a header row, or .ndjson/.jsonl file')
+@manager.option('resource', choices=sorted(dataload.IMPORTS), help='actors or movies')
+@manager.option('--format', dest='format', choices=('csv', 'ndjson'), help='file format when the extension does not tell')
+@manager.option('--chunk-size', dest='chunk_size', type=int, default=dataload.LOAD_CHUNK_SIZE, help='rows per COPY or INSERT batch')
+def import_data(resource, path, format, chunk_size):
+    '''streams actors or movies from a CSV or NDJSON file into the database'''
+    print(f'{dataload.import_file(path, resource, format, chunk_size)} {resource} imported')
+
+
+#python3 manage.py profiles --top 5
+@manager.option('--dir', dest='directory', default=profiling.PROFILE_DIR, help='directory the profiles were written to')
+@manager.option('--top', dest='top', type=int, default=10, help='routes to show')
+@manager.option('--functions', dest='functions', type=int, default=5, help='functions to show per route')
+def profiles(directory, top, functions):
+    '''summarises the slowest routes of the collected request profiles'''
+    summaries = profiling.summarize(directory, top, functions)
+    if not summaries:
+        print(f'No profiles in {directory}')
+    for summary in summaries:
+        print('{method} {route}: {requests} profiled, mean {mean:.1f} ms, max {max:.1f} ms, '
+              '{mean_queries:.1f} SQL statements taking {sql:.1f} ms'.format(
+                  mean=summary['mean_seconds'] * 1000, max=summary['max_seconds'] * 1000,
+                  sql=summary['mean_query_seconds'] * 1000, **summary))
+        for function, seconds in summary['functions']:
+            print(f'    {seconds * 1000:8.2f} ms  {function}')
 
 if __name__ == '__main__':
     manager.run()
\ No newline at end of file
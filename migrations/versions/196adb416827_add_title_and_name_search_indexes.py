@@ -0,0 +1,32 @@
+"""add title and name search indexes
+
+Revision ID: 196adb416827
+Revises: e7427d24ead0
+Create Date: 2026-10-18 10:03:18.274915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '196adb416827'
+down_revision = 'e7427d24ead0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # trigram GIN indexes back the ILIKE '%q%' of /search; other backends scan
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute('CREATE INDEX IF NOT EXISTS ix_movies_title_trgm ON movies USING gin (title gin_trgm_ops)')
+    op.execute('CREATE INDEX IF NOT EXISTS ix_actors_name_trgm ON actors USING gin (name gin_trgm_ops)')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('DROP INDEX IF EXISTS ix_actors_name_trgm')
+    op.execute('DROP INDEX IF EXISTS ix_movies_title_trgm')
@@ -0,0 +1,36 @@
+"""add external keys
+
+Revision ID: be22a3487c4a
+Revises: d293c1d93ad3
+Create Date: 2026-10-18 20:14:09.516237
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'be22a3487c4a'
+down_revision = 'd293c1d93ad3'
+branch_labels = None
+depends_on = None
+
+TABLES = ('actors', 'movies')
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    for table in TABLES:
+        # databases set up with db.create_all() may already have the column
+        if 'external_key' in [column['name'] for column in inspector.get_columns(table)]:
+            continue
+        op.add_column(table, sa.Column('external_key', sa.String(), nullable=True))
+        # unique, so PUT /<table>/by-key/<key> can upsert with ON CONFLICT (external_key); NULLs do not conflict
+        op.create_index(op.f(f'ix_{table}_external_key'), table, ['external_key'], unique=True)
+
+
+def downgrade():
+    for table in TABLES:
+        op.drop_index(op.f(f'ix_{table}_external_key'), table_name=table)
+        with op.batch_alter_table(table) as batch_op:  # SQLite cannot drop columns in place
+            batch_op.drop_column('external_key')
@@ -0,0 +1,34 @@
+"""add table versions
+
+Revision ID: d293c1d93ad3
+Revises: e8f4ea5814f2
+Create Date: 2026-10-18 13:40:07.918262
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd293c1d93ad3'
+down_revision = 'e8f4ea5814f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # databases set up with db.create_all() may already have the table
+    if 'table_versions' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            'table_versions',
+            sa.Column('name', sa.String(), nullable=False),
+            sa.Column('version', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('name')
+        )
+    # seeding the rows up front keeps concurrent first writes from racing on the insert
+    op.execute("INSERT INTO table_versions (name, version) SELECT 'actors', 0 WHERE NOT EXISTS (SELECT 1 FROM table_versions WHERE name = 'actors')")
+    op.execute("INSERT INTO table_versions (name, version) SELECT 'movies', 0 WHERE NOT EXISTS (SELECT 1 FROM table_versions WHERE name = 'movies')")
+
+
+def downgrade():
+    op.drop_table('table_versions')
@@ -0,0 +1,33 @@
+"""add list filter indexes
+
+Revision ID: e7427d24ead0
+Revises: f46850faab97
+Create Date: 2026-10-18 09:12:41.503127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7427d24ead0'
+down_revision = 'f46850faab97'
+branch_labels = None
+depends_on = None
+
+# Databases set up with db.create_all() already have these indexes, hence IF NOT EXISTS.
+INDEXES = (
+    ('ix_actors_gender', 'actors', 'gender'),
+    ('ix_actors_age', 'actors', 'age'),
+    ('ix_movies_releasedate', 'movies', 'releasedate'),
+)
+
+
+def upgrade():
+    for name, table, column in INDEXES:
+        op.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({column})')
+
+
+def downgrade():
+    for name, table, column in INDEXES:
+        op.execute(f'DROP INDEX IF EXISTS {name}')
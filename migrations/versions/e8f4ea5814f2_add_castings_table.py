@@ -0,0 +1,36 @@
+"""add castings table
+
+Revision ID: e8f4ea5814f2
+Revises: 196adb416827
+Create Date: 2026-10-18 11:26:52.630448
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8f4ea5814f2'
+down_revision = '196adb416827'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # databases set up with db.create_all() may already have the table
+    if 'castings' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        'castings',
+        sa.Column('movie_id', sa.Integer(), nullable=False),
+        sa.Column('actor_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['movie_id'], ['movies.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['actor_id'], ['actors.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('movie_id', 'actor_id')
+    )
+    op.create_index(op.f('ix_castings_actor_id'), 'castings', ['actor_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_castings_actor_id'), table_name='castings')
+    op.drop_table('castings')
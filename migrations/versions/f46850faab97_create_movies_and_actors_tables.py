@@ -0,0 +1,43 @@
+"""create movies and actors tables
+
+Revision ID: f46850faab97
+Revises: 
+Create Date: 2026-10-18 16:02:37.284519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f46850faab97'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # databases set up before the migrations got these tables from db.create_all()
+    tables = sa.inspect(op.get_bind()).get_table_names()
+    if 'movies' not in tables:
+        op.create_table(
+            'movies',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('title', sa.String(), nullable=False),
+            sa.Column('releasedate', sa.Date(), nullable=False),
+            sa.PrimaryKeyConstraint('id')
+        )
+    if 'actors' not in tables:
+        op.create_table(
+            'actors',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(), nullable=False),
+            sa.Column('age', sa.Integer(), nullable=False),
+            sa.Column('gender', sa.String(), nullable=False),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+
+def downgrade():
+    op.drop_table('actors')
+    op.drop_table('movies')
@@ -1,24 +1,111 @@
+import datetime
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+from sqlalchemy import Column, String, Integer, create_engine, event, exc, literal_column, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.pool import Pool
 from flask_sqlalchemy import SQLAlchemy
 import json
 
+from cache import response_cache
+from instrumentation import TimedQueuePool
+from replicas import RoutingSQLAlchemy, REPLICA_CONNECT_TIMEOUT
+
+#Connection pool settings, per process. Each gunicorn worker opens up to DB_POOL_SIZE + DB_MAX_OVERFLOW connections.
+#app.config keys of the same name take precedence over the environment.
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))               #seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))             #seconds before a connection is replaced, -1 never
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', 0))      #milliseconds, PostgreSQL only, 0 disables it
+
 database_name = "castingagency"
-database_path = "postgresql://{}/{}".format('postgres:secret@localhost:5432', database_name)
-# for Heroku
-#database_path = os.environ.get('DATABASE_URL').replace("://", "ql://", 1)
-db = SQLAlchemy()
+
+def normalize_database_url(url):
+    if url.startswith('postgres://'):  #SQLAlchemy 1.4+ only accepts the postgresql:// scheme, Heroku still hands out postgres://
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+def get_database_url():
+    '''DATABASE_URL from the environment (e.g. Heroku), the local database otherwise'''
+    url = os.environ.get('DATABASE_URL')
+    if not url:
+        return "postgresql://{}/{}".format('postgres:secret@localhost:5432', database_name)
+    return normalize_database_url(url)
+
+def get_replica_urls(config):
+    '''read replica URLs from config or DATABASE_REPLICA_URLS, given as a list or a comma-separated string'''
+    urls = config.get('DATABASE_REPLICA_URLS', os.environ.get('DATABASE_REPLICA_URLS', ''))
+    if isinstance(urls, str):
+        urls = urls.split(',')
+    return [normalize_database_url(url.strip()) for url in urls if url.strip()]
+
+database_path = get_database_url()
+db = RoutingSQLAlchemy()  #GET and HEAD requests read from db.replicas when replicas are configured
+
+def engine_options(database_path, config):
+    '''SQLAlchemy create_engine() options for database_path, read from config with the environment as default'''
+    if database_path.startswith('sqlite'):  #SQLite uses its own single-connection pools
+        return {}
+    options = {
+        'poolclass': TimedQueuePool,  #records connection checkout wait
+        'pool_size': int(config.get('DB_POOL_SIZE', DB_POOL_SIZE)),
+        'max_overflow': int(config.get('DB_MAX_OVERFLOW', DB_MAX_OVERFLOW)),
+        'pool_timeout': int(config.get('DB_POOL_TIMEOUT', DB_POOL_TIMEOUT)),
+        'pool_recycle': int(config.get('DB_POOL_RECYCLE', DB_POOL_RECYCLE)),
+        'pool_pre_ping': str(config.get('DB_POOL_PRE_PING', DB_POOL_PRE_PING)).lower() in ('1', 'true', 'yes')
+    }
+    statement_timeout = int(config.get('DB_STATEMENT_TIMEOUT', DB_STATEMENT_TIMEOUT))
+    if statement_timeout and database_path.startswith('postgresql'):
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+    return options
+
+def replica_engine_options(database_path, config):
+    '''engine_options() with a short connect timeout, so a replica that drops packets cannot stall its health check'''
+    options = engine_options(database_path, config)
+    if database_path.startswith('postgresql'):
+        connect_args = options.setdefault('connect_args', {})
+        connect_args['connect_timeout'] = int(config.get('REPLICA_CONNECT_TIMEOUT', REPLICA_CONNECT_TIMEOUT))
+    return options
 
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
 '''
-def setup_db(app, database_path=database_path):
+def setup_db(app, database_path=database_path, replica_paths=None):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(database_path, app.config)  #recomputed, setup_db may run again with another URL
+    if replica_paths is None:
+        replica_paths = get_replica_urls(app.config)
+    db.replicas.configure(replica_paths, lambda path: create_engine(path, **replica_engine_options(path, app.config)))
     db.app = app
-    db.init_app(app)
-    db.create_all()
+    db.init_app(app)  #engines connect lazily, the schema is created by the migrations (python3 manage.py db upgrade)
+
+def dispose_engine():
+    '''closes every pooled connection, e.g. in a preloaded gunicorn master before it forks workers'''
+    if db.app is not None:
+        db.get_engine(db.app).dispose()
+    db.replicas.dispose()
+
+'''
+Fork safety
+A pooled connection must never be used by two processes, they would interleave
+on the same socket. Connections remember the pid that opened them and are
+discarded, not closed, when checked out in another process; the pool then opens
+a fresh one.
+'''
+@event.listens_for(Pool, 'connect')
+def remember_pid(dbapi_connection, connection_record):
+    connection_record.info['pid'] = os.getpid()
+
+@event.listens_for(Pool, 'checkout')
+def check_pid(dbapi_connection, connection_record, connection_proxy):
+    pid = os.getpid()
+    if connection_record.info.get('pid', pid) != pid:
+        connection_record.connection = connection_proxy.connection = None
+        raise exc.DisconnectionError(
+            f"Connection record belongs to pid {connection_record.info['pid']}, attempting to check out in pid {pid}")
 
 def db_drop_and_create_all():
     db.drop_all()
@@ -40,15 +127,15 @@ def db_drop_and_create_all():
     )
     movie1 = Movie(
         title='Test Movie1',
-        releasedate='2022-01-31'
+        releasedate=datetime.date(2022, 1, 31)
     )
     movie2 = Movie(
         title='Test Movie2',
-        releasedate='2023-01-31'
+        releasedate=datetime.date(2023, 1, 31)
     )
     movie3 = Movie(
         title='Test Movie3',
-        releasedate='2024-01-31'
+        releasedate=datetime.date(2024, 1, 31)
     )
     db.session.add(actor1)
     db.session.add(actor2)
@@ -56,42 +143,158 @@ def db_drop_and_create_all():
     db.session.add(movie1)
     db.session.add(movie2)
     db.session.add(movie3)
+    movie1.cast = [actor1, actor2]  #after the adds, a cascade would otherwise add movie3 before movie2 and swap their ids
+    movie3.cast = [actor3]
     db.session.commit()
  
-#Movies with attributes: title and release date
-class Movie(db.Model):
-    __tablename__ = 'movies'
+#Version counter per table, bumped in the same transaction as every write to it
+class TableVersion(db.Model):
+    __tablename__ = 'table_versions'
+    name = db.Column(db.String(), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
 
-    id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String(), nullable = False)
-    releasedate = db.Column(db.Date, nullable=False) 
-    #helper functions
-    def insert(self):
+def bump_version(name):
+    table = TableVersion.__table__
+    updated = db.session.execute(
+        table.update().where(table.c.name == name).values(version=table.c.version + 1)
+    ).rowcount
+    if not updated:  #first write to this table since the schema was created
+        db.session.execute(table.insert().values(name=name, version=1))
+    response_cache.invalidate(name)
+
+def get_versions(*names):
+    '''returns the current version of each table in one query, 0 for tables never written to'''
+    rows = db.session.query(TableVersion.name, TableVersion.version).filter(TableVersion.name.in_(names)).all()
+    versions = dict(rows)
+    return [versions.get(name, 0) for name in names]
+
+#helper functions shared by Movie and Actor
+#commit=False leaves the transaction open so several changes can be committed together (POST /batch)
+class ModelMixin:
+    def insert(self, commit=True):
         db.session.add(self)
-        db.session.commit()
+        bump_version(self.__tablename__)
+        if commit:
+            db.session.commit()
+        else:
+            db.session.flush()  #assigns the id
 
-    def delete(self):
+    def delete(self, commit=True):
         db.session.delete(self)
-        db.session.commit()
+        bump_version(self.__tablename__)
+        if commit:
+            db.session.commit()
+
+    def update(self, commit=True):
+        bump_version(self.__tablename__)
+        if commit:
+            db.session.commit()
 
-    def update(self):
+    '''
+    bulk_insert(records)
+        inserts a list of column dicts in one transaction and returns the new ids in order.
+        PostgreSQL gets a single multi-row INSERT ... RETURNING id, other backends insert
+        row by row on the same transaction.
+    '''
+    @classmethod
+    def bulk_insert(cls, records):
+        if not records:
+            return []
+        table = cls.__table__
+        if db.session.get_bind(cls.__mapper__).dialect.name == 'postgresql':
+            result = db.session.execute(table.insert().values(records).returning(table.c.id))
+            ids = [row[0] for row in result]
+        else:
+            ids = [db.session.execute(table.insert(), record).inserted_primary_key[0] for record in records]
+        bump_version(cls.__tablename__)
         db.session.commit()
+        return ids
+
+    '''
+    upsert_by_key(records)
+        inserts or updates a list of column dicts by their external_key in one transaction.
+        Returns [(id, created)] in the order of records; a key repeated in records is
+        written once, with its last values. PostgreSQL gets a single INSERT ... ON CONFLICT
+        DO UPDATE ... RETURNING, SQLite (3.24+) the same upsert plus two lookups since it
+        has no RETURNING here.
+    '''
+    @classmethod
+    def upsert_by_key(cls, records, commit=True):
+        if not records:
+            return []
+        table = cls.__table__
+        unique = list({record['external_key']: record for record in records}.values())  #one row may only be touched once per statement
+        keys = [record['external_key'] for record in unique]
+        columns = list(unique[0])
+
+        if db.session.get_bind(cls.__mapper__).dialect.name == 'postgresql':
+            statement = postgresql.insert(table).values(unique)
+            statement = statement.on_conflict_do_update(
+                index_elements=[table.c.external_key],
+                set_={column: statement.excluded[column] for column in columns if column != 'external_key'}
+            ).returning(table.c.external_key, table.c.id, literal_column('xmax = 0'))  #xmax is 0 for freshly inserted rows
+            rows = {row[0]: (row[1], row[2]) for row in db.session.execute(statement)}
+        else:
+            existing = {row[0] for row in db.session.query(table.c.external_key).filter(table.c.external_key.in_(keys))}
+            db.session.execute(text(
+                f"INSERT INTO {table.name} ({', '.join(columns)}) VALUES ({', '.join(':' + column for column in columns)}) "
+                f"ON CONFLICT (external_key) DO UPDATE SET "
+                f"{', '.join(f'{column} = excluded.{column}' for column in columns if column != 'external_key')}"
+            ), unique)
+            ids = db.session.query(table.c.external_key, table.c.id).filter(table.c.external_key.in_(keys))
+            rows = {key: (id, key not in existing) for key, id in ids}
+
+        bump_version(cls.__tablename__)
+        if commit:
+            db.session.commit()
+        return [rows[record['external_key']] for record in records]
+
+    '''
+    update_by_id(id, values) / delete_by_id(id)
+        change one row with a single UPDATE or DELETE statement, without loading it first.
+        Return the number of matched rows, so 0 means the id does not exist.
+    '''
+    @classmethod
+    def update_by_id(cls, id, values, commit=True):
+        count = cls.query.filter(cls.id == id).update(values, synchronize_session=False)
+        if count:
+            bump_version(cls.__tablename__)
+        if commit:
+            db.session.commit()
+        return count
+
+    @classmethod
+    def delete_by_id(cls, id, commit=True):
+        count = cls.query.filter(cls.id == id).delete(synchronize_session=False)
+        if count:
+            bump_version(cls.__tablename__)
+        if commit:
+            db.session.commit()
+        return count
+
+#Castings link each movie to the actors cast in it
+castings = db.Table(
+    'castings',
+    db.Column('movie_id', db.Integer, db.ForeignKey('movies.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('actor_id', db.Integer, db.ForeignKey('actors.id', ondelete='CASCADE'), primary_key=True, index=True)
+)
+
+#Movies with attributes: title and release date
+class Movie(ModelMixin, db.Model):
+    __tablename__ = 'movies'
+
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(), nullable = False)
+    releasedate = db.Column(db.Date, nullable=False, index=True) 
+    external_key = db.Column(db.String(), unique=True, index=True)  #optional client-supplied key for idempotent upserts
+    cast = db.relationship('Actor', secondary=castings, back_populates='movies', order_by='Actor.id', passive_deletes=True)
 
 #Actors with attributes: name, age and gender
-class Actor(db.Model):
+class Actor(ModelMixin, db.Model):
     __tablename__ = 'actors'
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(), nullable = False)
-    age = db.Column(db.Integer, nullable = False)
-    gender = db.Column(db.String(), nullable=False) 
-  #helper functions
-    def insert(self):
-        db.session.add(self)
-        db.session.commit()
-
-    def delete(self):
-        db.session.delete(self)
-        db.session.commit()
-
-    def update(self):
-        db.session.commit()
+    age = db.Column(db.Integer, nullable = False, index=True)
+    gender = db.Column(db.String(), nullable=False, index=True) 
+    external_key = db.Column(db.String(), unique=True, index=True)  #optional client-supplied key for idempotent upserts
+    movies = db.relationship('Movie', secondary=castings, back_populates='cast', order_by='Movie.id', passive_deletes=True)
@@ -0,0 +1,64 @@
+import base64
+import binascii
+import json
+import os
+from flask import request, abort
+
+DEFAULT_PAGE_SIZE = int(os.environ.get('DEFAULT_PAGE_SIZE', 50))
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', 500))
+
+'''
+Keyset pagination
+Pages are addressed by the last id of the previous page instead of an offset, so
+every page is one indexed range scan and deep pages cost the same as the first.
+The cursor is opaque to clients: urlsafe base64 of {"id": <last id>}.
+'''
+def encode_cursor(last_id):
+    raw = json.dumps({'id': last_id}, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        last_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))['id']
+    except (binascii.Error, ValueError, TypeError, KeyError, UnicodeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(last_id, int) or isinstance(last_id, bool):
+        raise ValueError('Invalid cursor')
+    return last_id
+
+def int_arg(name, default):
+    '''request.args[name] as an int, default if it is absent; aborts with 422 if it is not an integer'''
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        abort(422)
+
+def get_page_args():
+    '''reads limit and after from the query string, aborts with 422 if they are invalid'''
+    limit = int_arg('limit', DEFAULT_PAGE_SIZE)  #not args.get(type=int), which falls back to the default on garbage
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        abort(422)
+
+    after = request.args.get('after')
+    if after is not None:
+        try:
+            after = decode_cursor(after)
+        except ValueError:
+            abort(422)
+    return limit, after
+
+def keyset_page(query, column, limit, after=None):
+    '''returns (rows, next_cursor) for the page of query following the id in after'''
+    if after is not None:
+        query = query.filter(column > after)
+    rows = query.order_by(column).limit(limit + 1).all()  #one extra row tells us whether there is a next page
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(getattr(rows[-1], column.key))
+    return rows, next_cursor
@@ -0,0 +1,143 @@
+import cProfile
+import datetime
+import glob
+import hmac
+import json
+import os
+import pstats
+import random
+import re
+import time
+from flask import g, request
+
+from instrumentation import current_route
+
+#Opt-in request profiling. app.config keys of the same name take precedence over the environment.
+PROFILE_ENABLED = os.environ.get('PROFILE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))  #fraction of requests profiled, 0 only on request
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')  #when set, "X-Profile: <PROFILE_TOKEN>" profiles that request
+PROFILE_HEADER = 'X-Profile'
+
+'''
+Profiling
+A profiled request runs under cProfile from before_request to teardown_request
+and leaves two files in PROFILE_DIR named after the time, pid, method and route:
+<name>.prof, readable with pstats or snakeviz, and <name>.json with the request,
+its duration and every SQL statement it issued with its time. Requests are picked
+at random with PROFILE_SAMPLE_RATE, or on demand with the X-Profile header, which
+is only honoured when it carries PROFILE_TOKEN. Requests that are not profiled
+pay for at most one random() call.
+'''
+def should_profile(sample_rate, token):
+    if token and hmac.compare_digest(request.headers.get(PROFILE_HEADER, '').encode('utf-8'), token.encode('utf-8')):  #str only compares ASCII
+        return True
+    return sample_rate > 0 and random.random() < sample_rate
+
+def route_slug(route):
+    '''/actors/<int:actor_id> -> actors_int_actor_id, for file names'''
+    return re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+
+def write_profile(directory, profile, record):
+    '''writes profile and its record as <name>.prof and <name>.json, returns the path without extension'''
+    os.makedirs(directory, exist_ok=True)
+    started = datetime.datetime.utcfromtimestamp(record['started'])
+    name = f"{started:%Y%m%dT%H%M%S%f}-{os.getpid()}-{record['method']}-{route_slug(record['route'])}"
+    path = os.path.join(directory, name)
+    profile.dump_stats(path + '.prof')
+    with open(path + '.json', 'w') as f:
+        json.dump(record, f, indent=1)
+    return path
+
+'''
+init_app(app)
+    profiles sampled or requested requests when PROFILE_ENABLED is set, does nothing otherwise.
+'''
+def init_app(app):
+    if str(app.config.get('PROFILE_ENABLED', PROFILE_ENABLED)).lower() not in ('1', 'true', 'yes'):
+        return
+    sample_rate = float(app.config.get('PROFILE_SAMPLE_RATE', PROFILE_SAMPLE_RATE))
+    token = app.config.get('PROFILE_TOKEN', PROFILE_TOKEN)
+    directory = app.config.get('PROFILE_DIR', PROFILE_DIR)
+
+    @app.before_request
+    def start_profile():
+        if should_profile(sample_rate, token):
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:  #Python 3.12+ allows one profiler at a time, another thread's request has it
+                return
+            g.sql_statements = []  #filled by instrumentation's SQL listeners
+            g.profile_started = time.time()
+            g.profile = profile
+
+    @app.after_request
+    def record_profile_status(response):
+        if 'profile' in g:
+            g.profile_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def stop_profile(exception):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return
+        profile.disable()
+        statements = g.pop('sql_statements')
+        started = g.pop('profile_started')
+        record = {
+            'route': current_route(),
+            'method': request.method,
+            'path': request.path,
+            'status': g.pop('profile_status', 500),
+            'started': started,
+            'seconds': time.time() - started,
+            'queries': [{'statement': statement, 'seconds': seconds} for statement, seconds in statements],
+            'query_seconds': sum(seconds for statement, seconds in statements)
+        }
+        try:
+            write_profile(directory, profile, record)
+        except OSError as e:
+            app.logger.warning('Could not write the profile of %s %s: %s', request.method, request.path, e)
+
+'''
+summarize(directory, top, functions)
+    groups the profiles in directory by route and returns the top routes by mean
+    duration, each with its request count, mean and max seconds, mean SQL statements
+    and SQL seconds, and the functions with the most own time across its profiles.
+'''
+def summarize(directory=PROFILE_DIR, top=10, functions=5):
+    routes = {}
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        with open(path) as f:
+            record = json.load(f)
+        routes.setdefault((record['method'], record['route']), []).append((path[:-len('.json')], record))
+
+    summaries = []
+    for (method, route), profiles in routes.items():
+        seconds = [record['seconds'] for _, record in profiles]
+        summaries.append({
+            'method': method,
+            'route': route,
+            'requests': len(profiles),
+            'mean_seconds': sum(seconds) / len(seconds),
+            'max_seconds': max(seconds),
+            'mean_queries': sum(len(record['queries']) for _, record in profiles) / len(profiles),
+            'mean_query_seconds': sum(record['query_seconds'] for _, record in profiles) / len(profiles),
+            'profiles': [path + '.prof' for path, _ in profiles]
+        })
+    summaries.sort(key=lambda summary: summary['mean_seconds'], reverse=True)
+    summaries = summaries[:top]
+    for summary in summaries:
+        summary['functions'] = hottest_functions(summary.pop('profiles'), functions)
+    return summaries
+
+def hottest_functions(paths, count):
+    '''[(function, own seconds per request)] with the most own time across the .prof files in paths'''
+    paths = [path for path in paths if os.path.exists(path)]
+    if not paths:
+        return []
+    stats = pstats.Stats(*paths).stats
+    hottest = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)[:count]
+    return [(pstats.func_std_string(function), timing[2] / len(paths)) for function, timing in hottest]
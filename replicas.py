@@ -0,0 +1,172 @@
+import itertools
+import logging
+import os
+import threading
+import time
+from flask import has_request_context, request
+from flask_sqlalchemy import BaseQuery, SQLAlchemy, SignallingSession
+from sqlalchemy import exc, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.sql.elements import TextClause
+from sqlalchemy.sql.selectable import SelectBase
+
+import instrumentation
+
+REPLICA_RETRY_INTERVAL = int(os.environ.get('REPLICA_RETRY_INTERVAL', 30))  #seconds an unreachable replica is skipped
+REPLICA_HEALTH_TTL = float(os.environ.get('REPLICA_HEALTH_TTL', 5))         #seconds a successful health check is trusted
+REPLICA_CONNECT_TIMEOUT = int(os.environ.get('REPLICA_CONNECT_TIMEOUT', 3))  #seconds, PostgreSQL only, so a dead replica fails fast
+
+READ_ONLY_METHODS = ('GET', 'HEAD')
+
+logger = logging.getLogger(__name__)
+
+'''
+ReplicaSet
+Read replica engines handed out round-robin. A replica is health-checked with
+SELECT 1 at most every REPLICA_HEALTH_TTL seconds; one that cannot be reached is
+skipped for REPLICA_RETRY_INTERVAL seconds, and when none is available choose()
+returns None so the caller falls back to the primary. A replica that fails a read
+after passing its check is skipped the same way through mark_down().
+'''
+class ReplicaSet:
+    def __init__(self, retry_interval=REPLICA_RETRY_INTERVAL, health_ttl=REPLICA_HEALTH_TTL, clock=time.monotonic):
+        self.retry_interval = retry_interval
+        self.health_ttl = health_ttl
+        self.clock = clock
+        self.urls = []
+        self._engine_factory = None
+        self._engines = None
+        self._cycle = iter(())
+        self._down_until = {}
+        self._checked_at = {}
+        self._lock = threading.Lock()
+
+    def configure(self, urls, engine_factory=None):
+        '''engines are created from urls by engine_factory(url) on first use, not at startup'''
+        self.dispose()
+        with self._lock:
+            self.urls = list(urls)
+            self._engine_factory = engine_factory
+            self._engines = None
+            self._down_until = {}
+            self._checked_at = {}
+
+    @property
+    def engines(self):
+        if self._engines is None:
+            with self._lock:
+                if self._engines is None:
+                    engines = [self._engine_factory(url) for url in self.urls]
+                    self._cycle = itertools.cycle(engines)
+                    self._engines = engines
+        return self._engines
+
+    def dispose(self):
+        for engine in self._engines or ():
+            engine.dispose()
+
+    def choose(self):
+        for _ in range(len(self.engines)):
+            with self._lock:
+                engine = next(self._cycle)
+            if self._available(engine):
+                return engine
+        return None
+
+    def _available(self, engine):
+        now = self.clock()
+        if self._down_until.get(engine, now) > now:
+            return False
+        checked_at = self._checked_at.get(engine)
+        if checked_at is not None and now - checked_at < self.health_ttl:
+            return True
+        try:
+            with engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+        except exc.DBAPIError as e:
+            self.mark_down(engine, e)
+            return False
+        self._checked_at[engine] = now
+        return True
+
+    def mark_down(self, engine, error):
+        '''skips engine for retry_interval seconds'''
+        logger.warning('Read replica %r unavailable, using the primary: %s', engine.url, error)
+        instrumentation.DB_REPLICA_UNAVAILABLE.inc()
+        self._down_until[engine] = self.clock() + self.retry_interval
+        self._checked_at.pop(engine, None)
+
+def is_read_only_request():
+    return has_request_context() and request.method in READ_ONLY_METHODS
+
+'''
+RoutingSession
+Sends SELECTs issued while serving a GET or HEAD request to one replica, picked
+once per session so every read of a request sees the same snapshot. Anything else
+(writes, flushes, SELECT ... FOR UPDATE, requests with other methods, code running
+outside a request) goes to the primary. Once a GET has written (INSERT, UPDATE,
+DELETE, text SQL, a flush or a locking SELECT) the session stays on the primary,
+so a request reads its own writes; a get_bind() that only asks for the dialect
+does not pin it. A query that fails on the replica is retried once on the primary
+by RoutingQuery, and the replica is marked down.
+'''
+class RoutingSession(SignallingSession):
+    def __init__(self, db, replicas=None, **options):
+        self.replicas = replicas
+        self._replica = None
+        self._primary_only = False
+        SignallingSession.__init__(self, db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if not self._primary_only and self.replicas is not None and self.replicas.urls:
+            if self._is_replica_read(clause):
+                if self._replica is None:
+                    self._replica = self.replicas.choose() or False
+                if self._replica:
+                    return self._replica
+            elif is_read_only_request() and self._is_write(clause):
+                self._primary_only = True
+        return SignallingSession.get_bind(self, mapper, clause)
+
+    def use_primary(self):
+        '''routes the rest of this session to the primary, e.g. before reading data another request just wrote'''
+        self._primary_only = True
+
+    def replica_failed(self, error):
+        '''after error from a read: marks the replica down and pins the session to the primary.
+        False if the read did not go to a replica, there is nothing to retry then.'''
+        if self._primary_only or not self._replica:
+            return False
+        self.replicas.mark_down(self._replica, error)
+        self._primary_only = True
+        return True
+
+    def _is_write(self, clause):
+        return self._flushing or isinstance(clause, (UpdateBase, TextClause, SelectBase))  #a SelectBase here locks rows
+
+    def _is_replica_read(self, clause):
+        return (is_read_only_request() and not self._flushing and isinstance(clause, SelectBase)
+                and getattr(clause, '_for_update_arg', None) is None)
+
+class RoutingQuery(BaseQuery):
+    '''BaseQuery that retries a read on the primary when its replica fails'''
+    def __iter__(self):
+        try:
+            return BaseQuery.__iter__(self)
+        except exc.DBAPIError as e:
+            if self._for_update_arg is not None or not isinstance(self.session, RoutingSession):
+                raise
+            if not self.session.replica_failed(e):
+                raise
+            return BaseQuery.__iter__(self)
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    '''SQLAlchemy whose sessions route read-only requests to db.replicas'''
+    def __init__(self, *args, **kwargs):
+        self.replicas = ReplicaSet()
+        kwargs.setdefault('query_class', RoutingQuery)
+        SQLAlchemy.__init__(self, *args, **kwargs)
+
+    def create_session(self, options):
+        return sessionmaker(class_=RoutingSession, db=self, replicas=self.replicas, **options)
@@ -0,0 +1,60 @@
+import os
+from sqlalchemy import case, func, literal, select, union_all
+
+from models import db, Movie, Actor
+
+SEARCH_DEFAULT_LIMIT = int(os.environ.get('SEARCH_DEFAULT_LIMIT', 20))
+SEARCH_MAX_LIMIT = int(os.environ.get('SEARCH_MAX_LIMIT', 50))
+SEARCH_MAX_PAGE = int(os.environ.get('SEARCH_MAX_PAGE', 10))  #hard cap on how deep a broad query can be paged
+SEARCH_MAX_CANDIDATES = int(os.environ.get('SEARCH_MAX_CANDIDATES', 1000))  #matches ranked per table, bounds a broad query's work
+SEARCH_MIN_LENGTH = 3  #pg_trgm extracts no trigram from shorter patterns, the GIN indexes would not be used
+SEARCH_MAX_LENGTH = 100
+
+'''
+Title and name search
+Matches Movie.title and Actor.name by case-insensitive substring. On PostgreSQL the
+ILIKE is served by the pg_trgm GIN indexes created by migration and results are
+ranked by trigram similarity. Other backends (SQLite in tests) fall back to LIKE
+and rank exact matches over prefixes over substrings. Only the first
+SEARCH_MAX_CANDIDATES matches of each table are ranked, so a broad query stops
+scanning early instead of scoring and sorting every match.
+'''
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def _matches(column, q, dialect):
+    '''returns (condition, rank) for the rows of column matching q'''
+    if dialect == 'postgresql':
+        return column.ilike('%' + _escape_like(q) + '%', escape='\\'), func.similarity(column, q)
+
+    lowered = func.lower(column)
+    escaped = _escape_like(q.lower())
+    rank = case([
+        (lowered == q.lower(), 1.0),
+        (lowered.like(escaped + '%', escape='\\'), 0.75)
+    ], else_=0.5)
+    return lowered.like('%' + escaped + '%', escape='\\'), rank
+
+def _select(model, kind, column, q, dialect):
+    condition, _ = _matches(column, q, dialect)
+    candidates = select([model.id.label('id'), column.label('text')]).where(condition) \
+        .limit(SEARCH_MAX_CANDIDATES).alias(f'{kind}_candidates')  #limited before ranking
+    _, rank = _matches(candidates.c.text, q, dialect)
+    return select([
+        literal(kind).label('type'),
+        candidates.c.id,
+        candidates.c.text,
+        rank.label('rank')
+    ])
+
+def search(q, limit, page):
+    '''returns one page of ranked matches as (type, id, text, rank) rows, best match first'''
+    dialect = db.engine.dialect.name  #not the session's bind, asking it would keep a GET off the replicas
+    results = union_all(
+        _select(Movie, 'movie', Movie.title, q, dialect),
+        _select(Actor, 'actor', Actor.name, q, dialect)
+    ).alias('results')
+    query = select([results]).order_by(
+        results.c.rank.desc(), results.c.text, results.c.type, results.c.id
+    ).limit(limit + 1).offset((page - 1) * limit)
+    return db.session.execute(query).fetchall()
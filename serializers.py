@@ -0,0 +1,80 @@
+import datetime
+import decimal
+import json
+from flask import Response, request, abort
+
+from models import Movie, Actor
+
+try:
+    import orjson  #optional, several times faster than the standard library encoder
+except ImportError:
+    orjson = None
+
+'''
+JSON encoding
+dumps() returns UTF-8 bytes, using orjson when it is installed and the standard
+library otherwise. Dates are encoded as ISO-8601 (YYYY-MM-DD) by both.
+'''
+def _default(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data, default=_default)
+    return json.dumps(data, default=_default, separators=(',', ':')).encode('utf-8')
+
+def json_response(data, status=200):
+    return Response(dumps(data), status=status, mimetype='application/json')
+
+'''
+ModelSerializer
+Declares once which columns of a model make up its JSON representation.
+select() turns a query into a column-only query, rows() maps the resulting
+tuples to dicts without going through ORM objects, objects() serialises
+already loaded entities (e.g. eager-loaded relationships).
+'''
+class ModelSerializer:
+    def __init__(self, model, fields):
+        self.model = model
+        self.fields = tuple(fields)
+        self.columns = [getattr(model, field) for field in self.fields]
+
+    def only(self, fields):
+        '''returns a serializer restricted to fields, in declaration order. id is always kept
+        since pagination needs it. Raises ValueError for fields the model does not expose.'''
+        unknown = set(fields) - set(self.fields)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        return ModelSerializer(self.model, [field for field in self.fields if field == 'id' or field in fields])
+
+    def select(self, query):
+        return query.with_entities(*self.columns)
+
+    def rows(self, rows):
+        fields = self.fields
+        return [dict(zip(fields, row)) for row in rows]
+
+    def objects(self, objects):
+        fields = self.fields
+        return [{field: getattr(some_object, field) for field in fields} for some_object in objects]
+
+def get_fields_arg(serializer):
+    '''applies ?fields=a,b to serializer, aborts with 422 on unknown or empty field lists'''
+    fields = request.args.get('fields')
+    if fields is None:
+        return serializer
+    requested = [field.strip() for field in fields.split(',') if field.strip()]
+    if not requested:
+        abort(422)
+    try:
+        return serializer.only(requested)
+    except ValueError:
+        abort(422)
+
+actor_serializer = ModelSerializer(Actor, ('id', 'name', 'age', 'gender', 'external_key'))
+movie_serializer = ModelSerializer(Movie, ('id', 'title', 'releasedate', 'external_key'))
+cast_member_serializer = ModelSerializer(Actor, ('id', 'name'))
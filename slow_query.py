@@ -0,0 +1,153 @@
+import collections
+import datetime
+import logging
+import os
+import queue
+import threading
+from flask import has_request_context, request
+
+import instrumentation
+
+#Slow query log settings. app.config keys of the same name take precedence over the environment.
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 500))  #0 disables the log
+SLOW_QUERY_LOG_SIZE = int(os.environ.get('SLOW_QUERY_LOG_SIZE', 100))              #entries kept, oldest dropped first
+SLOW_QUERY_EXPLAIN = os.environ.get('SLOW_QUERY_EXPLAIN', 'false').lower() in ('1', 'true', 'yes')
+SLOW_QUERY_EXPLAIN_QUEUE = 10            #slow queries waiting for EXPLAIN, more are not explained
+SLOW_QUERY_MAX_PARAMETER_SETS = 10       #executemany parameter sets kept per entry
+
+logger = logging.getLogger(__name__)
+
+'''
+SlowQueryLog
+Ring buffer of the statements that took longer than threshold_ms, with their bound
+parameters, duration and the route and method of the request that issued them.
+With explain set, slow SELECTs on PostgreSQL are run again under EXPLAIN (ANALYZE,
+BUFFERS) by a background thread on a connection of their own, which is rolled
+back; the plan is added to the entry when it is ready. Only SELECTs are explained,
+since ANALYZE executes the statement.
+'''
+class SlowQueryLog:
+    def __init__(self, threshold_ms=SLOW_QUERY_THRESHOLD_MS, size=SLOW_QUERY_LOG_SIZE, explain=SLOW_QUERY_EXPLAIN):
+        self.threshold_ms = threshold_ms
+        self.explain = explain
+        self._entries = collections.deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._explain_queue = None
+        self._explainer_pid = None
+
+    def configure(self, threshold_ms, size, explain):
+        with self._lock:
+            self.threshold_ms = threshold_ms
+            self.explain = explain
+            self._entries = collections.deque(self._entries, maxlen=size)
+
+    def entries(self):
+        '''newest first'''
+        with self._lock:
+            return [dict(entry) for entry in reversed(self._entries)]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def record(self, engine, statement, parameters, seconds, executemany):
+        duration_ms = seconds * 1000
+        if not self.threshold_ms or duration_ms < self.threshold_ms:
+            return None
+        if executemany:
+            parameters = {'count': len(parameters), 'first': list(parameters[:SLOW_QUERY_MAX_PARAMETER_SETS])}
+        entry = {
+            'statement': statement,
+            'parameters': jsonable(parameters),
+            'duration_ms': round(duration_ms, 3),
+            'route': instrumentation.current_route() if has_request_context() else None,
+            'method': request.method if has_request_context() else None,
+            'recorded_at': datetime.datetime.utcnow().isoformat() + 'Z',
+            'explain': None
+        }
+        instrumentation.DB_SLOW_QUERIES.inc()
+        logger.warning('Slow query (%.1f ms) in %s %s: %s %r', duration_ms, entry['method'], entry['route'],
+                       statement, entry['parameters'])
+        if self.explain and engine.dialect.name == 'postgresql' and not executemany and is_select(statement):
+            entry['explain'] = 'pending'
+            self._queue_explain(engine, statement, parameters, entry)
+        with self._lock:
+            self._entries.append(entry)
+        return entry
+
+    def _queue_explain(self, engine, statement, parameters, entry):
+        self._start_explainer()
+        try:
+            self._explain_queue.put_nowait((engine, statement, parameters, entry))
+        except queue.Full:
+            entry['explain'] = 'skipped, too many slow queries waiting'
+
+    def _start_explainer(self):
+        pid = os.getpid()
+        if self._explainer_pid != pid:  #threads do not survive a fork, every gunicorn worker starts its own
+            with self._lock:
+                if self._explainer_pid != pid:
+                    self._explain_queue = queue.Queue(SLOW_QUERY_EXPLAIN_QUEUE)
+                    threading.Thread(target=self._explain_forever, args=(self._explain_queue,),
+                                     name='slow-query-explain', daemon=True).start()
+                    self._explainer_pid = pid
+
+    def _explain_forever(self, explain_queue):
+        while True:
+            engine, statement, parameters, entry = explain_queue.get()
+            entry['explain'] = explain(engine, statement, parameters)
+
+def explain(engine, statement, parameters):
+    '''EXPLAIN (ANALYZE, BUFFERS) output of statement, or the error it raised, as text'''
+    connection = None
+    try:
+        connection = engine.raw_connection()  #the DBAPI connection, so the EXPLAIN itself is not timed and logged
+        cursor = connection.cursor()
+        try:
+            cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + statement, parameters)
+            return '\n'.join(row[0] for row in cursor.fetchall())
+        finally:
+            cursor.close()
+    except Exception as e:
+        return f'EXPLAIN failed: {e}'
+    finally:
+        if connection is not None:
+            connection.close()  #the pool rolls the transaction back on return
+
+def is_select(statement):
+    return statement.lstrip().upper().startswith('SELECT')
+
+def jsonable(value):
+    '''bound parameters as JSON-serializable values, anything unusual as its repr'''
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {str(key): jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [jsonable(item) for item in value]
+    return repr(value)
+
+slow_query_log = SlowQueryLog()
+
+def _record_statement(conn, statement, parameters, seconds, executemany):
+    slow_query_log.record(conn.engine, statement, parameters, seconds, executemany)
+
+def install_sql_listeners():
+    '''records statements timed by instrumentation's SQL listeners'''
+    instrumentation.install_sql_listeners()
+    if _record_statement not in instrumentation.statement_observers:
+        instrumentation.statement_observers.append(_record_statement)
+
+'''
+init_app(app)
+    applies the app's slow query settings and starts recording.
+'''
+def init_app(app):
+    slow_query_log.configure(
+        float(app.config.get('SLOW_QUERY_THRESHOLD_MS', SLOW_QUERY_THRESHOLD_MS)),
+        int(app.config.get('SLOW_QUERY_LOG_SIZE', SLOW_QUERY_LOG_SIZE)),
+        str(app.config.get('SLOW_QUERY_EXPLAIN', SLOW_QUERY_EXPLAIN)).lower() in ('1', 'true', 'yes')
+    )
+    install_sql_listeners()
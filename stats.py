@@ -0,0 +1,48 @@
+import os
+from sqlalchemy import extract, func
+
+from models import db, Movie, Actor
+from cache import TTLCache
+
+AGE_BUCKET_SIZE = int(os.environ.get('AGE_BUCKET_SIZE', 10))
+STATS_CACHE_TTL = int(os.environ.get('STATS_CACHE_TTL', 30))  #seconds, 0 computes the stats on every request
+
+stats_cache = TTLCache(STATS_CACHE_TTL)
+
+'''
+Aggregate statistics
+Every figure is computed by the database (COUNT / GROUP BY), one round trip per
+aggregate, so no rows are loaded into Python.
+'''
+def compute_stats():
+    counts = db.session.query(
+        db.session.query(func.count(Actor.id)).label('actors'),
+        db.session.query(func.count(Movie.id)).label('movies')
+    ).one()
+
+    by_gender = db.session.query(Actor.gender, func.count(Actor.id)) \
+        .group_by(Actor.gender).order_by(Actor.gender).all()
+
+    bucket = (Actor.age / AGE_BUCKET_SIZE) * AGE_BUCKET_SIZE  #integer division on both PostgreSQL and SQLite
+    by_age = db.session.query(bucket.label('bucket'), func.count(Actor.id)) \
+        .group_by(bucket).order_by(bucket).all()
+
+    year = extract('year', Movie.releasedate)
+    by_year = db.session.query(year.label('year'), func.count(Movie.id)) \
+        .group_by(year).order_by(year).all()
+
+    return {
+        'actors': counts.actors,
+        'movies': counts.movies,
+        'actors_by_gender': [{'gender': gender, 'count': count} for gender, count in by_gender],
+        'actors_by_age': [{'min_age': int(start), 'max_age': int(start) + AGE_BUCKET_SIZE - 1, 'count': count} for start, count in by_age],
+        'movies_by_year': [{'year': int(year), 'count': count} for year, count in by_year]
+    }
+
+def get_stats():
+    '''returns the cached stats if they are younger than STATS_CACHE_TTL, computes them otherwise'''
+    stats = stats_cache.get('stats')
+    if stats is None:
+        stats = compute_stats()
+        stats_cache.set('stats', stats)
+    return stats
@@ -1,31 +1,27 @@
-import os
 import unittest
 import json
-from flask_sqlalchemy import SQLAlchemy
+import datetime
+from unittest import mock
+from sqlalchemy import event
 
-from app import create_app
-from models import setup_db, Movie, Actor, db_drop_and_create_all
+from models import Movie, Actor, db
+from stats import stats_cache
+import serializers
+import slow_query
+import test_support
 
 class CastingAgencyTestCase(unittest.TestCase):
     """This class represents the casting agency test case"""
     def setUp(self):
         # """Define test variables and initialize app."""
-        self.app = create_app()
+        self.app = test_support.get_app()  #schema and seed data are created once per session
         self.client = self.app.test_client
-        self.database_name = "castingagency_test"
-        self.database_path = "postgresql://{}/{}".format('postgres:secret@localhost:5432', self.database_name)
-        setup_db(self.app, self.database_path)
-        # binds the app to the current context
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            # create all tables
-            self.db.create_all()
-        db_drop_and_create_all()
-        self.userToken = os.environ.get("userToken") 
+        self.transaction = test_support.TransactionFixture(self.app).start()  #rolled back in tearDown
+        self.userToken = test_support.make_token()  #signed by the local test key, no Auth0 needed
         pass
     def tearDown(self):
         """Executed after each test"""
+        self.transaction.rollback()
         print("teardown completed")
         pass
     
@@ -38,6 +34,282 @@ class CastingAgencyTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertEqual(bool(data['actors']), True)  #Asserts that 'actors' contains some data
     
+    #positive test case that the liveness endpoint needs neither a token nor the database
+    def test_healthz(self):
+        print("test_healthz started")
+        response = self.client().get('/healthz')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['success'], True)
+
+    #positive test case that the readiness endpoint checks the database and the JWKS
+    def test_readyz(self):
+        print("test_readyz started")
+        with mock.patch('auth.jwks_store.ready', return_value=True):
+            response = self.client().get('/readyz')
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['checks'], {'database': 'ok', 'jwks': 'ok'})
+
+    #negative test case that the worker is not ready while the JWKS cannot be loaded
+    def test_503_readyz_without_jwks(self):
+        print("test_503_readyz_without_jwks started")
+        with mock.patch('auth.jwks_store.ready', side_effect=IOError('auth0 is down')):
+            response = self.client().get('/readyz')
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['checks']['jwks'], 'unavailable')
+
+    #positive test case that PUT by external key creates once and then updates the same row
+    def test_upsert_actor_by_key(self):
+        print("test_upsert_actor_by_key started")
+        headers = {"Authorization": f"Bearer {self.userToken}"}
+        body = {'name': 'Keyed Actor', 'age': 40, 'gender': 'Female'}
+        first = self.client().put('/actors/by-key/agency-42', json=body, headers=headers)
+        retry = self.client().put('/actors/by-key/agency-42', json=body, headers=headers)
+        changed = self.client().put('/actors/by-key/agency-42', json=dict(body, age=41), headers=headers)
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(changed.status_code, 200)
+        actor_id = json.loads(first.data)['id']
+        self.assertEqual(json.loads(retry.data)['id'], actor_id)
+        with self.app.app_context():
+            self.assertEqual(Actor.query.filter_by(external_key='agency-42').count(), 1)
+            self.assertEqual(Actor.query.get(actor_id).age, 41)
+
+    #positive test case that a CORS preflight allows the PUT upsert routes
+    def test_preflight_allows_put(self):
+        print("test_preflight_allows_put started")
+        response = self.client().options('/actors/by-key/agency-42', headers={
+            "Origin": "http://example.com", "Access-Control-Request-Method": "PUT"})
+        self.assertEqual(response.headers['Access-Control-Allow-Origin'], '*')
+        self.assertIn('PUT', response.headers['Access-Control-Allow-Methods'].split(','))
+
+    #negative test case that an upsert needs every field, like POST
+    def test_422_upsert_movie_missing_fields(self):
+        print("test_422_upsert_movie_missing_fields started")
+        response = self.client().put('/movies/by-key/film-1', json={'title': 'Keyed Movie'}, headers={"Authorization": f"Bearer {self.userToken}"})
+        self.assertEqual(response.status_code, 422)
+
+    #positive test case that the bulk upsert reports ids and whether each row was created
+    def test_bulk_upsert_movies_by_key(self):
+        print("test_bulk_upsert_movies_by_key started")
+        headers = {"Authorization": f"Bearer {self.userToken}"}
+        records = [
+            {'external_key': 'film-1', 'title': 'Keyed Movie 1', 'releasedate': '2021-05-01'},
+            {'external_key': 'film-2', 'title': 'Keyed Movie 2', 'releasedate': '2021-06-01'}
+        ]
+        self.client().put('/movies/by-key/film-1', json={'title': 'Old Title', 'releasedate': '2021-05-01'}, headers=headers)
+        response = self.client().put('/movies/by-key', json=records, headers=headers)
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(result['external_key'], result['created']) for result in data['results']], [('film-1', False), ('film-2', True)])
+        with self.app.app_context():
+            self.assertEqual(Movie.query.filter_by(external_key='film-1').one().title, 'Keyed Movie 1')
+
+    #positive test case that POST /batch applies every operation in one transaction
+    def test_batch(self):
+        print("test_batch started")
+        response = self.client().post('/batch', json={'operations': [
+            {'op': 'create', 'resource': 'actors', 'data': {'name': 'Batch Actor', 'age': 40, 'gender': 'Female'}},
+            {'op': 'update', 'resource': 'movies', 'id': 1, 'data': {'title': 'Renamed Movie'}},
+            {'op': 'delete', 'resource': 'actors', 'id': 2}
+        ]}, headers={"Authorization": f"Bearer {self.userToken}"})
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['results'][1:], [{'updated': 1}, {'deleted': 2}])
+        with self.app.app_context():
+            self.assertEqual(Actor.query.get(data['results'][0]['created']).name, 'Batch Actor')
+            self.assertEqual(Movie.query.get(1).title, 'Renamed Movie')
+            self.assertIsNone(Actor.query.get(2))
+
+    #negative test case that a failing operation rolls back the operations before it
+    def test_404_batch_rolls_back(self):
+        print("test_404_batch_rolls_back started")
+        response = self.client().post('/batch', json={'operations': [
+            {'op': 'create', 'resource': 'actors', 'data': {'name': 'Batch Actor', 'age': 40, 'gender': 'Female'}},
+            {'op': 'delete', 'resource': 'movies', 'id': 1000}
+        ]}, headers={"Authorization": f"Bearer {self.userToken}"})
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(data['errors'][0]['index'], 1)
+        with self.app.app_context():
+            self.assertEqual(Actor.query.filter_by(name='Batch Actor').count(), 0)
+
+    #negative test case that invalid operations are reported by index and nothing runs
+    def test_422_batch_with_invalid_operation(self):
+        print("test_422_batch_with_invalid_operation started")
+        response = self.client().post('/batch', json={'operations': [
+            {'op': 'delete', 'resource': 'actors', 'id': 1},
+            {'op': 'create', 'resource': 'movies', 'data': {'title': 'No Date'}}
+        ]}, headers={"Authorization": f"Bearer {self.userToken}"})
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual([error['index'] for error in data['errors']], [1])
+        with self.app.app_context():
+            self.assertIsNotNone(Actor.query.get(1))
+
+    #positive test case that /metrics exposes route latency, SQL counts and cache stats in Prometheus format
+    def test_metrics(self):
+        print("test_metrics started")
+        self.client().get('/actors', headers={"Authorization": f"Bearer {self.userToken}"})
+        response = self.client().get('/metrics')
+        body = response.data.decode('utf-8')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        self.assertIn('http_request_duration_seconds_count{route="/actors",method="GET",status="200"}', body)
+        self.assertIn('auth_duration_seconds_count{route="/actors"}', body)
+        self.assertIn('handler_duration_seconds_count{route="/actors"}', body)
+        self.assertIn('db_queries_per_request_count{route="/actors"}', body)
+        self.assertIn('# TYPE db_pool_checkout_wait_seconds histogram', body)  #samples only with a pooled backend such as PostgreSQL
+        self.assertIn('token_cache_hits_total', body)
+
+    #positive test case that statements over the threshold are listed with their route on the admin endpoint
+    def test_get_slow_queries(self):
+        print("test_get_slow_queries started")
+        slow_query.slow_query_log.clear()
+        with mock.patch.object(slow_query.slow_query_log, 'threshold_ms', 0.000001):
+            self.client().get('/actors', headers={"Authorization": f"Bearer {self.userToken}"})
+        token = test_support.make_token(('get:slow-queries',))
+        response = self.client().get('/admin/slow-queries', headers={"Authorization": f"Bearer {token}"})
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['queries'])
+        self.assertEqual({query['route'] for query in data['queries']}, {'/actors'})
+        self.assertTrue(any('FROM actors' in query['statement'] for query in data['queries']))
+
+    #negative test case that the slow query log needs the get:slow-queries permission
+    def test_get_slow_queries_forbidden(self):
+        print("test_get_slow_queries_forbidden started")
+        response = self.client().get('/admin/slow-queries', headers={"Authorization": f"Bearer {self.userToken}"})
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(data['success'], False)
+
+    #positive test case that GET actors pages through the actors with a cursor
+    def test_get_actors_paginated(self):
+        print("test_get_actors_paginated started")
+        response = self.client().get('/actors?limit=2', headers={"Authorization": f"Bearer {self.userToken}"})
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([actor['id'] for actor in data['actors']], [1, 2])
+        self.assertTrue(data['next'])
+        response = self.client().get(f"/actors?limit=2&after={data['next']}", headers={"Authorization": f"Bearer {self.userToken}"})
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([actor['id'] for actor in data['actors']], [3])
+        self.assertEqual(data['next'], None)  #last page has no next cursor
+
+    #positive test case that GET actors filters by gender and age range in SQL
+    def test_get_actors_filtered(self):
+        print("test_get_actors_filtered started")
+        response = self.client().get('/actors?gender=Male&min_age=20', headers={"Authorization": f"Bearer {self.userToken}"})
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([actor['id'] for actor in data['actors']], [3])
+
+    #negative test case that GET actors should not work with a non-numeric age filter
+    def test_422_get_actors_invalid_age_filter(self):
+        print("test_get_actors_invalid_age_filter started")
+        response = self.client().get('/actors?max_age=old', headers={"Authorization": f"Bearer {self.userToken}"})
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(data['success'], False)
+
+    #positive test case that GET actors answers 304 while the actors table is unchanged
+    def test_304_get_actors_not_modified(self):
+        print("test_get_actors_not_modified started")
+        response = self.client().get('/actors', headers={"Authorization": f"Bearer {self.userToken}"})
+        etag = response.headers['ETag']
+        response, queries = self.count_queries_with_headers('/actors', {"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        self.assertEqual(queries, 1)  #only the version lookup, no actor rows are loaded
+
+    #positive test case that a write to the actors table changes the ETag of GET actors
+    def test_get_actors_etag_changes_after_write(self):
+        print("test_get_actors_etag_changes_after_write started")
+        response = self.client().get('/actors', headers={"Authorization": f"Bearer {self.userToken}"})
+        etag = response.headers['ETag']
+        self.client().patch('/actors/1', headers={"Authorization": f"Bearer {self.userToken}"}, json={'age': 11})
+        response = self.client().get('/actors', headers={"Authorization": f"Bearer {self.userToken}", "If-None-Match": etag})
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(data['actors'][0]['age'], 11)
+
+    #positive test case that a repeated GET actors is served from the response cache
+    def test_get_actors_served_from_cache(self):
+        print("test_get_actors_served_from_cache started")
+        first = self.client().get('/actors', headers={"Authorization": f"Bearer {self.userToken}"})
+        second = self.client().get('/actors', headers={"Authorization": f"Bearer {self.userToken}"})
+        self.assertEqual(first.headers['X-Cache'], 'MISS')
+        self.assertEqual(second.headers['X-Cache'], 'HIT')
+        self.assertEqual(first.data, second.data)
+
+    #positive test case that a write invalidates the cached GET actors response
+    def test_post_actors_invalidates_cache(self):
+        print("test_post_actors_invalidates_cache started")
+        self.client().get('/actors', headers={"Authorization": f"Bearer {self.userToken}"})
+        self.client().post('/actors', headers={"Authorization": f"Bearer {self.userToken}"}, json={'name': 'New Actor', 'age': 22, 'gender': 'Female'})
+        response = self.client().get('/actors', headers={"Authorization": f"Bearer {self.userToken}"})
+        data = json.loads(response.data)
+        self.assertEqual(response.headers['X-Cache'], 'MISS')
+        self.assertEqual(len(data['actors']), 4)
+
+    #positive test case that GET actors?fields= only returns and selects the requested columns
+    def test_get_actors_sparse_fields(self):
+        print("test_get_actors_sparse_fields started")
+        statements = []
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        with self.app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            response = self.client().get('/actors?fields=name', headers={"Authorization": f"Bearer {self.userToken}"})
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['actors'][0], {'id': 1, 'name': 'Test Actor1'})  #id is always included
+        self.assertNotIn('actors.age', statements[-1])
+
+    #negative test case that GET actors should not work with an unknown field
+    def test_422_get_actors_unknown_field(self):
+        print("test_get_actors_unknown_field started")
+        response = self.client().get('/actors?fields=name,salary', headers={"Authorization": f"Bearer {self.userToken}"})
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(data['success'], False)
+
+    #negative test case that GET actors should not work with a malformed cursor
+    def test_422_get_actors_invalid_cursor(self):
+        print("test_get_actors_invalid_cursor started")
+        response = self.client().get('/actors?after=not-a-cursor', headers={"Authorization": f"Bearer {self.userToken}"})
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'Unprocessable')
+
+    #positive test case that GET actors/export streams every actor as newline-delimited JSON
+    def test_export_actors(self):
+        print("test_export_actors started")
+        response = self.client().get('/actors/export', headers={"Authorization": f"Bearer {self.userToken}"})
+        actors = [json.loads(line) for line in response.data.decode('utf-8').splitlines()]
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertEqual([actor['id'] for actor in actors], [1, 2, 3])
+
+    #negative test case that GET actors/export should not work without a bearer token
+    def test_401_export_actors_without_token(self):
+        print("test_export_actors_without_token started")
+        response = self.client().get('/actors/export')
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(data['success'], False)
+
     #negative test case that GET actors should not work when you try to GET a particular actor
     def test_405_requesting_particular_actor(self):
         print("test_requesting particular actor started")
@@ -56,6 +328,136 @@ class CastingAgencyTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertEqual(bool(data['movies']), True)  #Asserts that 'movies' contains some data
     
+    #positive test case that GET movies returns one page and a cursor to the next one
+    def test_get_movies_paginated(self):
+        print("test_get_movies_paginated started")
+        response = self.client().get('/movies?limit=1', headers={"Authorization": f"Bearer {self.userToken}"})
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(data['movies']), 1)
+        self.assertTrue(data['next'])
+
+    #positive test case that GET movies filters by release window and title prefix in SQL
+    def test_get_movies_filtered(self):
+        print("test_get_movies_filtered started")
+        response = self.client().get('/movies?released_after=2023-01-01&released_before=2024-12-31', headers={"Authorization": f"Bearer {self.userToken}"})
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([movie['id'] for movie in data['movies']], [2, 3])
+        response = self.client().get('/movies?title=Test%20Movie1', headers={"Authorization": f"Bearer {self.userToken}"})
+        data = json.loads(response.data)
+        self.assertEqual([movie['id'] for movie in data['movies']], [1])
+
+    #negative test case that GET movies should not work with a malformed date filter
+    def test_422_get_movies_invalid_date_filter(self):
+        print("test_get_movies_invalid_date_filter started")
+        response = self.client().get('/movies?released_after=31-01-2022', headers={"Authorization": f"Bearer {self.userToken}"})
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(data['success'], False)
+
+    #positive test case that GET movies encodes release dates as ISO-8601
+    def test_get_movies_iso_dates(self):
+        print("test_get_movies_iso_dates started")
+        response = self.client().get('/movies', headers={"Authorization": f"Bearer {self.userToken}"})
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/json')
+        self.assertEqual([movie['releasedate'] for movie in data['movies']], ['2022-01-31', '2023-01-31', '2024-01-31'])
+
+    #positive test case that the standard library fallback encodes the same JSON as orjson
+    def test_serializer_fallback_without_orjson(self):
+        print("test_serializer_fallback_without_orjson started")
+        data = {'id': 1, 'releasedate': datetime.date(2022, 1, 31)}
+        with mock.patch.object(serializers, 'orjson', None):
+            self.assertEqual(json.loads(serializers.dumps(data)), {'id': 1, 'releasedate': '2022-01-31'})
+        self.assertEqual(json.loads(serializers.dumps(data)), {'id': 1, 'releasedate': '2022-01-31'})
+
+    #positive test case that GET movies?fields= also applies to embedded casts
+    def test_get_movies_sparse_fields_with_cast(self):
+        print("test_get_movies_sparse_fields_with_cast started")
+        response = self.client().get('/movies?fields=title&include=cast&limit=1', headers={"Authorization": f"Bearer {self.userToken}"})
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(data['movies'][0]), ['cast', 'id', 'title'])
+
+    #negative test case that GET movies should not work with a page size above the maximum
+    def test_422_get_movies_limit_too_large(self):
+        print("test_get_movies_limit_too_large started")
+        response = self.client().get('/movies?limit=100000', headers={"Authorization": f"Bearer {self.userToken}"})
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(data['success'], False)
+
+    #negative test case that GET movies should not work with a page size that is not an integer
+    def test_422_get_movies_limit_not_integer(self):
+        print("test_get_movies_limit_not_integer started")
+        response = self.client().get('/movies?limit=abc', headers={"Authorization": f"Bearer {self.userToken}"})
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(data['success'], False)
+
+    #positive test case that GET movies/export streams every movie with an ISO release date
+    def test_export_movies(self):
+        print("test_export_movies started")
+        response = self.client().get('/movies/export', headers={"Authorization": f"Bearer {self.userToken}"})
+        movies = [json.loads(line) for line in response.data.decode('utf-8').splitlines()]
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(movies), 3)
+        self.assertEqual(movies[0]['releasedate'], '2022-01-31')
+
+    #counts the SQL statements issued while requesting url
+    def count_queries(self, url):
+        return self.count_queries_with_headers(url, {})
+
+    def count_queries_with_headers(self, url, headers):
+        statements = []
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        with self.app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            response = self.client().get(url, headers={"Authorization": f"Bearer {self.userToken}", **headers})
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+        return response, len(statements)
+
+    #positive test case that GET movies?include=cast embeds the cast without one query per movie
+    def test_get_movies_include_cast(self):
+        print("test_get_movies_include_cast started")
+        response, page_of_one = self.count_queries('/movies?include=cast&limit=1')
+        response, page_of_three = self.count_queries('/movies?include=cast&limit=3')
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([actor['id'] for actor in data['movies'][0]['cast']], [1, 2])
+        self.assertEqual(data['movies'][1]['cast'], [])
+        self.assertEqual(page_of_one, page_of_three)  #query count does not grow with the number of movies
+
+    #positive test case that GET movies/<id>/cast lists the actors cast in a movie
+    def test_get_movie_cast(self):
+        print("test_get_movie_cast started")
+        response = self.client().get('/movies/1/cast', headers={"Authorization": f"Bearer {self.userToken}"})
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([actor['name'] for actor in data['cast']], ['Test Actor1', 'Test Actor2'])
+
+    #negative test case that GET movies/<id>/cast should not work for a non-existent movie
+    def test_404_get_cast_of_nonexistent_movie(self):
+        print("test_get_cast_of_nonexistent_movie started")
+        response = self.client().get('/movies/5000/cast', headers={"Authorization": f"Bearer {self.userToken}"})
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(data['success'], False)
+
+    #positive test case that GET actors/<id>/movies lists the movies an actor is cast in
+    def test_get_actor_movies(self):
+        print("test_get_actor_movies started")
+        response = self.client().get('/actors/3/movies', headers={"Authorization": f"Bearer {self.userToken}"})
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([movie['id'] for movie in data['movies']], [3])
+
     #negative test case that GET movies should not work when you try to GET a particular movie
     def test_405_requesting_particular_movie(self):
         print("test_requesting particular movie started")
@@ -65,6 +467,83 @@ class CastingAgencyTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'Method not allowed')
 
+    #positive test case that GET search returns ranked matches from movies and actors
+    def test_search(self):
+        print("test_search started")
+        response = self.client().get('/search?q=Test', headers={"Authorization": f"Bearer {self.userToken}"})
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(sorted(result['type'] for result in data['results']), ['actor'] * 3 + ['movie'] * 3)
+        ranks = [result['rank'] for result in data['results']]
+        self.assertEqual(ranks, sorted(ranks, reverse=True))
+
+    #positive test case that GET search pages through the results
+    def test_search_paginated(self):
+        print("test_search_paginated started")
+        response = self.client().get('/search?q=Movie&limit=2', headers={"Authorization": f"Bearer {self.userToken}"})
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(data['results']), 2)
+        self.assertEqual(data['next_page'], 2)
+
+    #negative test case that GET search ranks no more than SEARCH_MAX_CANDIDATES matches per table
+    def test_search_candidates_are_bounded(self):
+        print("test_search_candidates_are_bounded started")
+        with mock.patch('search.SEARCH_MAX_CANDIDATES', 1):
+            response = self.client().get('/search?q=Test', headers={"Authorization": f"Bearer {self.userToken}"})
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(result['type'] for result in data['results']), ['actor', 'movie'])
+        self.assertIsNone(data['next_page'])
+
+    #negative test case that GET search should not work beyond the page cap
+    def test_422_search_beyond_page_cap(self):
+        print("test_search_beyond_page_cap started")
+        response = self.client().get('/search?q=Test&page=1000', headers={"Authorization": f"Bearer {self.userToken}"})
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(data['success'], False)
+
+    #negative test case that GET search should not work with a limit or page that is not an integer
+    def test_422_search_arguments_not_integer(self):
+        print("test_search_arguments_not_integer started")
+        for args in ('limit=abc', 'page=xyz'):
+            response = self.client().get(f'/search?q=Test&{args}', headers={"Authorization": f"Bearer {self.userToken}"})
+            data = json.loads(response.data)
+            self.assertEqual(response.status_code, 422)
+            self.assertEqual(data['success'], False)
+
+    #negative test case that GET search should not work with a query shorter than a trigram
+    def test_422_search_query_too_short(self):
+        print("test_search_query_too_short started")
+        for q in ('a', 'ab'):
+            response = self.client().get(f'/search?q={q}', headers={"Authorization": f"Bearer {self.userToken}"})
+            data = json.loads(response.data)
+            self.assertEqual(response.status_code, 422)
+            self.assertEqual(data['success'], False)
+
+    #positive test case that GET stats returns counts and breakdowns computed by the database
+    def test_get_stats(self):
+        print("test_get_stats started")
+        stats_cache.clear()
+        response = self.client().get('/stats', headers={"Authorization": f"Bearer {self.userToken}"})
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['stats']['actors'], 3)
+        self.assertEqual(data['stats']['movies'], 3)
+        self.assertEqual(data['stats']['actors_by_gender'], [{'gender': 'Female', 'count': 1}, {'gender': 'Male', 'count': 2}])
+        self.assertEqual([bucket['min_age'] for bucket in data['stats']['actors_by_age']], [10, 20, 30])
+        self.assertEqual([year['year'] for year in data['stats']['movies_by_year']], [2022, 2023, 2024])
+
+    #negative test case that GET stats should not work without a bearer token
+    def test_401_get_stats_without_token(self):
+        print("test_get_stats_without_token started")
+        response = self.client().get('/stats')
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(data['success'], False)
+
     #positive test case that DELETE actors works as expected
     def test_delete_actors(self):
         print("test_delete_actors started")
@@ -77,13 +556,13 @@ class CastingAgencyTestCase(unittest.TestCase):
         self.assertEqual(actor, None) #confirms that actor #2 no longer exists (actor = None)
 
     #negative test case that DELETE actors should not work when you try to DELETE a non-existent actor
-    def test_422_deleting_nonexistent_actor(self):
+    def test_404_deleting_nonexistent_actor(self):
         print("test_delete nonexistent_actors started")
         response = self.client().delete('/actors/5000', headers={"Authorization": f"Bearer {self.userToken}"})
         data = json.loads(response.data)
-        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.status_code, 404)
         self.assertEqual(data['success'], False)
-        self.assertEqual(data['message'], 'Unprocessable')
+        self.assertEqual(data['message'], 'Resource not found')
 
   #positive test case that DELETE movies works as expected
     def test_delete_movies(self):
@@ -98,13 +577,13 @@ class CastingAgencyTestCase(unittest.TestCase):
         self.assertEqual(movie, None) #confirms that movie #2 no longer exists (movie = None)
 
     #negative test case that DELETE movies should not work when you try to DELETE a non-existent movie
-    def test_422_deleting_nonexistent_movie(self):
+    def test_404_deleting_nonexistent_movie(self):
         print("test_delete nonexistent movie started")
         response = self.client().delete('/movies/5000', headers={"Authorization": f"Bearer {self.userToken}"})
         data = json.loads(response.data)
-        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.status_code, 404)
         self.assertEqual(data['success'], False)
-        self.assertEqual(data['message'], 'Unprocessable')
+        self.assertEqual(data['message'], 'Resource not found')
   
     #positive test case that POST actors works as expected
     def test_post_actors(self):
@@ -148,6 +627,34 @@ class CastingAgencyTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'Unprocessable')
 
+    #positive test case that POST actors/bulk creates every actor in one request
+    def test_bulk_post_actors(self):
+        print("test_bulk_post_actors started")
+        self.new_actors = [
+            {'name': 'Actor A', 'age': 25, 'gender': 'Female'},
+            {'name': 'Actor B', 'age': 35, 'gender': 'Male'}
+        ]
+        response = self.client().post('/actors/bulk', headers={"Authorization": f"Bearer {self.userToken}"}, json=self.new_actors)
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(len(data['created']), 2)
+        self.assertEqual(Actor.query.count(), 5)
+
+    #negative test case that POST actors/bulk reports invalid records and inserts nothing
+    def test_422_bulk_post_actors_with_blank_values(self):
+        print("test_bulk_post_blank_actors started")
+        self.new_actors = [
+            {'name': 'Actor A', 'age': 25, 'gender': 'Female'},
+            {'name': '', 'age': 35, 'gender': 'Male'}
+        ]
+        response = self.client().post('/actors/bulk', headers={"Authorization": f"Bearer {self.userToken}"}, json=self.new_actors)
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['errors'], [{'index': 1, 'missing': ['name']}])
+        self.assertEqual(Actor.query.count(), 3)
+
     #positive test case that POST movies works as expected
     def test_post_movies(self):
         print("test_post_movies started")
@@ -187,6 +694,27 @@ class CastingAgencyTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'Unprocessable')
 
+    #positive test case that POST movies/bulk creates every movie in one request
+    def test_bulk_post_movies(self):
+        print("test_bulk_post_movies started")
+        self.new_movies = [
+            {'title': 'Movie A', 'releasedate': '2025-05-01'},
+            {'title': 'Movie B', 'releasedate': '2025-06-01'}
+        ]
+        response = self.client().post('/movies/bulk', headers={"Authorization": f"Bearer {self.userToken}"}, json=self.new_movies)
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(len(data['created']), 2)
+
+    #negative test case that POST movies/bulk should not work with an empty list
+    def test_422_bulk_post_movies_empty_list(self):
+        print("test_bulk_post_movies_empty_list started")
+        response = self.client().post('/movies/bulk', headers={"Authorization": f"Bearer {self.userToken}"}, json=[])
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(data['success'], False)
+
     #positive test case that PATCH actors works as expected
     def test_patch_actors(self):
         print("test_patch_actors started")
@@ -214,6 +742,35 @@ class CastingAgencyTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertEqual(data['updated'], 3)
 
+    #positive test case that PATCH actors only updates the fields that were sent
+    def test_partial_patch_actors(self):
+        print("test_partial_patch_actors started")
+        response = self.client().patch('/actors/3', headers={"Authorization": f"Bearer {self.userToken}"}, json={'age': 41})
+        data = json.loads(response.data)
+        actor = Actor.query.filter(Actor.id == 3).one_or_none()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['updated'], 3)
+        self.assertEqual(actor.age, 41)
+        self.assertEqual(actor.name, 'Test Actor3')  #fields that were not sent are left untouched
+
+    #negative test case that PATCH actors should not work when you try to PATCH a non-existent actor
+    def test_404_patching_nonexistent_actor(self):
+        print("test_patch_nonexistent_actor started")
+        response = self.client().patch('/actors/5000', headers={"Authorization": f"Bearer {self.userToken}"}, json={'age': 41})
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'Resource not found')
+
+    #negative test case that PATCH movies should not work with a blank value
+    def test_422_patching_movie_with_blank_title(self):
+        print("test_patch_blank_movie started")
+        response = self.client().patch('/movies/3', headers={"Authorization": f"Bearer {self.userToken}"}, json={'title': ''})
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'Unprocessable')
+
 # Make the tests conveniently executable
 if __name__ == "__main__":
     print("executing tests")
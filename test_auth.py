@@ -0,0 +1,237 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import rsa
+from flask import Flask, jsonify
+from jose.utils import long_to_base64
+
+import auth
+from auth import JWKSStore, TokenCache, file_jwks_fetcher, requires_auth
+
+_public_key, _private_key = rsa.newkeys(512)
+
+def make_jwks(*kids):
+    return {'keys': [{
+        'kty': 'RSA',
+        'kid': kid,
+        'use': 'sig',
+        'alg': 'RS256',
+        'n': long_to_base64(_public_key.n).decode('ascii'),
+        'e': long_to_base64(_public_key.e).decode('ascii')
+    } for kid in kids]}
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class StubFetcher:
+    def __init__(self, jwks):
+        self.jwks = jwks
+        self.calls = 0
+        self.error = None
+
+    def __call__(self):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return self.jwks
+
+class JWKSStoreTestCase(unittest.TestCase):
+    """This class represents the JWKS key store test case"""
+    def setUp(self):
+        self.clock = FakeClock()
+        self.fetcher = StubFetcher(make_jwks('key1'))
+        self.store = JWKSStore(self.fetcher, ttl=600, min_refresh_interval=30, clock=self.clock)
+
+    #positive test case that keys are fetched once and then served from memory
+    def test_keys_are_cached(self):
+        for _ in range(10):
+            self.assertIsNotNone(self.store.get_key('key1'))
+        self.assertEqual(self.fetcher.calls, 1)
+
+    #positive test case that an unknown kid triggers one refresh that picks up a rotated key
+    def test_unknown_kid_refreshes_once(self):
+        self.store.get_key('key1')
+        self.clock.now += 60
+        self.fetcher.jwks = make_jwks('key1', 'key2')
+        self.assertIsNotNone(self.store.get_key('key2'))
+        self.assertEqual(self.fetcher.calls, 2)
+
+    #negative test case that repeated unknown kids do not hammer the key endpoint
+    def test_unknown_kid_refresh_is_rate_limited(self):
+        self.store.get_key('key1')
+        for _ in range(10):
+            self.assertIsNone(self.store.get_key('bogus'))
+        self.assertEqual(self.fetcher.calls, 1)
+
+    #positive test case that the last good key set is served when a refresh fails
+    def test_failed_refresh_keeps_last_good_keys(self):
+        self.store.get_key('key1')
+        self.clock.now += 60
+        self.fetcher.error = IOError('auth0 is down')
+        self.store.refresh()
+        self.assertIsNotNone(self.store.get_key('key1'))
+
+    #negative test case that a cold store surfaces the fetch error
+    def test_cold_fetch_failure_raises(self):
+        self.fetcher.error = IOError('auth0 is down')
+        with self.assertRaises(IOError):
+            self.store.get_key('key1')
+
+    #positive test case that ready() loads the key set once and reports it as available
+    def test_ready_loads_keys(self):
+        self.assertTrue(self.store.ready())
+        self.assertTrue(self.store.ready())
+        self.assertEqual(self.fetcher.calls, 1)
+        self.assertEqual(self.store.kids, {'key1'})
+
+    #positive test case that a stale key set is served while it refreshes in the background
+    def test_stale_keys_refresh_in_background(self):
+        self.store.get_key('key1')
+        self.clock.now += 601
+        self.store._refresh_in_background = lambda: self.store._background_refresh()
+        self.fetcher.jwks = make_jwks('key3')
+        self.assertIsNotNone(self.store.get_key('key3'))
+        self.assertEqual(self.fetcher.calls, 2)
+
+    #positive test case that concurrent refreshes share a single fetch
+    def test_concurrent_refresh_is_single_flight(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_fetch():
+            self.fetcher.calls += 1
+            started.set()
+            release.wait(5)
+            return make_jwks('key1')
+
+        self.store.fetcher = slow_fetch
+        first = threading.Thread(target=self.store.refresh)
+        first.start()
+        started.wait(5)
+        waiters = [threading.Thread(target=self.store.refresh) for _ in range(5)]
+        for waiter in waiters:
+            waiter.start()
+        release.set()
+        for thread in [first] + waiters:
+            thread.join(5)
+        self.assertEqual(self.fetcher.calls, 1)
+
+    #positive test case that listeners are told when the key IDs change
+    def test_rotation_listener(self):
+        rotations = []
+        self.store.on_rotate(lambda: rotations.append(True))
+        self.store.get_key('key1')
+        self.clock.now += 60
+        self.fetcher.jwks = make_jwks('key2')
+        self.store.get_key('key2')
+        self.assertEqual(rotations, [True])
+
+    #positive test case that the file fetcher serves a local key set
+    def test_file_fetcher(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as jwks_file:
+            json.dump(make_jwks('local'), jwks_file)
+        self.addCleanup(os.remove, jwks_file.name)
+        store = JWKSStore(file_jwks_fetcher(jwks_file.name))
+        self.assertIsNotNone(store.get_key('local'))
+
+class TokenCacheTestCase(unittest.TestCase):
+    """This class represents the verified token cache test case"""
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = TokenCache(maxsize=2, clock=self.clock)
+        self.payload = {'exp': self.clock.now + 3600, 'permissions': ['get:actors']}
+
+    #positive test case that a verified token is served from the cache
+    def test_hit_after_put(self):
+        self.assertIsNone(self.cache.get('token1'))
+        self.cache.put('token1', self.payload)
+        self.assertEqual(self.cache.get('token1'), self.payload)
+        self.assertEqual(self.cache.stats(), {'hits': 1, 'misses': 1, 'size': 1})
+
+    #negative test case that entries are dropped once the token expires
+    def test_entry_expires_at_exp(self):
+        self.cache.put('token1', self.payload)
+        self.clock.now += 3600
+        self.assertIsNone(self.cache.get('token1'))
+        self.assertEqual(self.cache.stats()['size'], 0)
+
+    #negative test case that tokens without an exp claim are not cached
+    def test_token_without_exp_is_not_cached(self):
+        self.cache.put('token1', {'permissions': []})
+        self.assertIsNone(self.cache.get('token1'))
+
+    #positive test case that the least recently used token is evicted first
+    def test_lru_eviction(self):
+        self.cache.put('token1', self.payload)
+        self.cache.put('token2', self.payload)
+        self.cache.get('token1')
+        self.cache.put('token3', self.payload)
+        self.assertIsNone(self.cache.get('token2'))
+        self.assertIsNotNone(self.cache.get('token1'))
+
+    #positive test case that clear flushes every entry
+    def test_clear(self):
+        self.cache.put('token1', self.payload)
+        self.cache.clear()
+        self.assertIsNone(self.cache.get('token1'))
+
+    #positive test case that requires_auth verifies a repeated token only once
+    def test_requires_auth_skips_verification_on_hit(self):
+        app = Flask(__name__)
+
+        @app.route('/protected')
+        @requires_auth('get:actors')
+        def protected(payload):
+            return jsonify({'success': True})
+
+        self.payload['exp'] = 4102444800  #2100-01-01, requires_auth uses the real clock
+        with mock.patch.object(auth, 'token_cache', TokenCache()), \
+                mock.patch.object(auth, 'verify_decode_jwt', return_value=self.payload) as verify:
+            for _ in range(3):
+                response = app.test_client().get('/protected', headers={"Authorization": "Bearer token1"})
+                self.assertEqual(response.status_code, 200)
+            self.assertEqual(verify.call_count, 1)
+
+    #positive test case that requires_auth(check=False) only authenticates
+    def test_requires_auth_without_check(self):
+        app = Flask(__name__)
+
+        @app.route('/authenticated')
+        @requires_auth(check=False)
+        def authenticated(payload):
+            return jsonify({'success': True})
+
+        with mock.patch.object(auth, 'token_cache', TokenCache()), \
+                mock.patch.object(auth, 'verify_decode_jwt', return_value={'permissions': []}):
+            response = app.test_client().get('/authenticated', headers={"Authorization": "Bearer token1"})
+        self.assertEqual(response.status_code, 200)
+
+    #negative test case that requires_auth() with a forgotten permission fails closed
+    def test_requires_auth_without_permission_forbidden(self):
+        app = Flask(__name__)
+
+        @app.errorhandler(auth.AuthError)
+        def auth_error(error):
+            return jsonify(error.error), error.status_code
+
+        @app.route('/forgotten')
+        @requires_auth()
+        def forgotten(payload):
+            return jsonify({'success': True})
+
+        with mock.patch.object(auth, 'token_cache', TokenCache()), \
+                mock.patch.object(auth, 'verify_decode_jwt', return_value={'permissions': ['get:actors']}):
+            response = app.test_client().get('/forgotten', headers={"Authorization": "Bearer token1"})
+        self.assertEqual(response.status_code, 403)
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+from flask import Flask
+
+from benchmark import percentile, summarize, parse_size, ENDPOINTS, UNCACHED_ENDPOINTS, WSGIClient
+from cache import response_cache
+
+class BenchmarkTestCase(unittest.TestCase):
+    """This class represents the benchmark report test case"""
+    #positive test case for nearest-rank percentiles
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 99), 7)
+
+    #negative test case that an empty run has no percentiles
+    def test_percentile_empty(self):
+        self.assertIsNone(percentile([], 50))
+
+    #positive test case that latencies are reported in milliseconds with throughput
+    def test_summarize(self):
+        result = summarize([0.003, 0.001, 0.002, 0.004], 0.5, 1)
+        self.assertEqual(result['requests'], 4)
+        self.assertEqual(result['errors'], 1)
+        self.assertEqual(result['p50_ms'], 2.0)
+        self.assertEqual(result['p99_ms'], 4.0)
+        self.assertEqual(result['throughput_rps'], 8.0)
+
+    #positive test case for dataset sizes with suffixes
+    def test_parse_size(self):
+        self.assertEqual(parse_size('1000'), 1000)
+        self.assertEqual(parse_size('100k'), 100000)
+        self.assertEqual(parse_size('1M'), 1000000)
+
+    #positive test case that deletes walk down from the last seeded id
+    def test_delete_ids(self):
+        method, path, body = ENDPOINTS['DELETE /actors/<id>']
+        self.assertEqual([path(i, 1000) for i in range(3)], ['/actors/1000', '/actors/999', '/actors/998'])
+
+
+    #positive test case that uncached endpoints run with the response cache off, and it is restored afterwards
+    def test_uncached_client(self):
+        backend = response_cache.backend
+        client = WSGIClient(Flask(__name__), 'token', cached=False)
+        self.assertIsNone(response_cache.backend)
+        client.close()
+        self.assertIs(response_cache.backend, backend)
+        self.assertTrue(set(UNCACHED_ENDPOINTS) <= set(ENDPOINTS))
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
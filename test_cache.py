@@ -0,0 +1,94 @@
+import shutil
+import tempfile
+import time
+import unittest
+
+from cache import TTLCache, LRUBackend, FileBackend, ResponseCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class TTLCacheTestCase(unittest.TestCase):
+    """This class represents the TTL cache test case"""
+    #positive test case that entries expire after the ttl
+    def test_entries_expire(self):
+        clock = FakeClock()
+        cache = TTLCache(30, clock=clock)
+        cache.set('stats', {'actors': 3})
+        self.assertEqual(cache.get('stats'), {'actors': 3})
+        clock.now += 30
+        self.assertIsNone(cache.get('stats'))
+
+    #negative test case that a ttl of 0 disables the cache
+    def test_zero_ttl_disables_cache(self):
+        cache = TTLCache(0)
+        cache.set('stats', {'actors': 3})
+        self.assertIsNone(cache.get('stats'))
+
+class ResponseCacheTestCase(unittest.TestCase):
+    """This class represents the response cache test case, run against every backend"""
+    def backends(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        return [LRUBackend(maxsize=8), FileBackend(directory)]
+
+    #positive test case that stored bodies are returned and counted as hits
+    def test_hit_and_miss_counters(self):
+        for backend in self.backends():
+            cache = ResponseCache(backend)
+            self.assertIsNone(cache.get(('actors',), 'retrieve_actors:etag1'))
+            cache.set(('actors',), 'retrieve_actors:etag1', b'{"success": true}')
+            self.assertEqual(cache.get(('actors',), 'retrieve_actors:etag1'), b'{"success": true}')
+            self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'size': 1})
+
+    #positive test case that a write to a table drops every entry built from it
+    def test_invalidate_drops_dependent_entries(self):
+        for backend in self.backends():
+            cache = ResponseCache(backend)
+            cache.set(('actors',), 'a', b'actors')
+            cache.set(('movies', 'actors'), 'b', b'movies with cast')
+            cache.set(('movies',), 'c', b'movies')
+            cache.invalidate('actors')
+            self.assertIsNone(cache.get(('actors',), 'a'))
+            self.assertIsNone(cache.get(('movies', 'actors'), 'b'))
+            self.assertEqual(cache.get(('movies',), 'c'), b'movies')
+
+    #positive test case that the memory backend evicts the least recently used entry
+    def test_lru_backend_is_bounded(self):
+        backend = LRUBackend(maxsize=2)
+        backend.set('actors', 'a', b'1')
+        backend.set('actors', 'b', b'2')
+        backend.get('actors', 'a')
+        backend.set('actors', 'c', b'3')
+        self.assertIsNone(backend.get('actors', 'b'))
+        self.assertEqual(len(backend), 2)
+
+    #positive test case that the file backend evicts the least recently used entry
+    def test_file_backend_is_bounded(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        backend = FileBackend(directory, maxsize=2)
+        backend.set('actors', 'a', b'1')
+        time.sleep(0.01)
+        backend.set('actors', 'b', b'2')
+        time.sleep(0.01)
+        backend.get('actors', 'a')
+        time.sleep(0.01)
+        backend.set('movies', 'c', b'3')
+        self.assertIsNone(backend.get('actors', 'b'))
+        self.assertEqual(backend.get('actors', 'a'), b'1')
+        self.assertEqual(len(backend), 2)
+
+    #negative test case that a disabled cache never hits
+    def test_disabled_cache(self):
+        cache = ResponseCache(None)
+        cache.set(('actors',), 'a', b'actors')
+        self.assertIsNone(cache.get(('actors',), 'a'))
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import dataload
+import test_support
+from models import db, Actor, Movie, castings, get_versions
+
+class DataLoadTestCase(unittest.TestCase):
+    """This class represents the bulk loading test case"""
+    def setUp(self):
+        self.app = test_support.get_app()
+        self.context = self.app.test_request_context()  #like manage.py, a GET request context
+        self.context.push()
+        self.transaction = test_support.TransactionFixture(self.app).start()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.transaction.rollback()
+        self.context.pop()
+        shutil.rmtree(self.directory, True)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    #positive test case that the same seed generates the same rows
+    def test_generators_are_reproducible(self):
+        self.assertEqual(list(dataload.generate_actors(5, seed=1)), list(dataload.generate_actors(5, seed=1)))
+        self.assertNotEqual(list(dataload.generate_movies(5, seed=1)), list(dataload.generate_movies(5, seed=2)))
+
+    #positive test case that generated rows are loaded in chunks with castings among the new rows
+    def test_generate(self):
+        actors, movies = Actor.query.count(), Movie.query.count()
+        loaded = dataload.generate(25, 10, castings_per_movie=3, seed=1, chunk_size=7)
+        self.assertEqual(loaded['actors'], 25)
+        self.assertEqual(loaded['movies'], 10)
+        self.assertEqual(Actor.query.count(), actors + 25)
+        self.assertEqual(Movie.query.count(), movies + 10)
+        links = db.session.query(castings.c.movie_id, castings.c.actor_id).filter(castings.c.movie_id > 3).all()
+        self.assertEqual(len(links), loaded['castings'])
+        self.assertTrue(all(actor_id > 3 for movie_id, actor_id in links))
+        actor_ids = {id for id, in db.session.query(Actor.id)}
+        self.assertTrue(all(actor_id in actor_ids for movie_id, actor_id in links))
+
+    #negative test case that a failing castings load also rolls back the actors and movies
+    def test_generate_is_one_transaction(self):
+        actors, movies = Actor.query.count(), Movie.query.count()
+        with mock.patch.object(dataload, 'generate_castings', side_effect=ValueError('no castings')):
+            with self.assertRaises(ValueError):
+                dataload.generate(5, 5, castings_per_movie=2)
+        self.assertEqual((Actor.query.count(), Movie.query.count()), (actors, movies))
+
+    #positive test case that a load bumps the table version so cached lists are invalidated
+    def test_load_bumps_version(self):
+        version, = get_versions('actors')
+        dataload.load_rows(Actor.__table__, dataload.ACTOR_COLUMNS, dataload.generate_actors(3))
+        self.assertEqual(get_versions('actors'), [version + 1])
+
+    #positive test case for a CSV import with an optional external key
+    def test_import_csv(self):
+        path = self.write('actors.csv', 'name,age,gender,external_key\nAnn Lee,33,Female,a-1\nBo Chen,41,Male,\n')
+        self.assertEqual(dataload.import_file(path, 'actors'), 2)
+        ann = Actor.query.filter_by(external_key='a-1').one()
+        self.assertEqual((ann.name, ann.age), ('Ann Lee', 33))
+        self.assertIsNone(Actor.query.filter_by(name='Bo Chen').one().external_key)
+
+    #positive test case for an NDJSON import, blank lines are skipped
+    def test_import_ndjson(self):
+        path = self.write('movies.ndjson', '{"title": "X", "releasedate": "2020-01-02"}\n\n{"title": "Y", "releasedate": "2021-03-04"}\n')
+        self.assertEqual(dataload.import_file(path, 'movies'), 2)
+        self.assertEqual(str(Movie.query.filter_by(title='Y').one().releasedate), '2021-03-04')
+
+    #negative test case that an invalid row aborts the whole import and names its line
+    def test_import_invalid_row(self):
+        movies = Movie.query.count()
+        path = self.write('movies.jsonl', '{"title": "X", "releasedate": "2020-01-02"}\n{"title": "Y"}\n')
+        with self.assertRaisesRegex(ValueError, 'line 2: releasedate is missing'):
+            dataload.import_file(path, 'movies', chunk_size=1)
+        self.assertEqual(Movie.query.count(), movies)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
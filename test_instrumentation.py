@@ -0,0 +1,86 @@
+import unittest
+from unittest import mock
+from flask import Flask
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+import instrumentation
+from instrumentation import Counter, Histogram, CallbackMetric, Registry, TimedQueuePool, POOL_WAIT_SECONDS
+
+class MetricsTestCase(unittest.TestCase):
+    """This class represents the metrics registry test case"""
+    #positive test case that histogram buckets are cumulative and end with +Inf
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram('latency_seconds', 'Latency.', ('route',), buckets=(0.1, 1.0))
+        histogram.observe(0.05, route='/actors')
+        histogram.observe(0.5, route='/actors')
+        histogram.observe(5, route='/actors')
+        samples = list(histogram.samples())
+        self.assertEqual(samples, [
+            'latency_seconds_bucket{route="/actors",le="0.1"} 1',
+            'latency_seconds_bucket{route="/actors",le="1.0"} 2',
+            'latency_seconds_bucket{route="/actors",le="+Inf"} 3',
+            'latency_seconds_sum{route="/actors"} 5.55',
+            'latency_seconds_count{route="/actors"} 3'
+        ])
+
+    #positive test case that the registry renders help and type lines for every metric
+    def test_render_prometheus_text(self):
+        registry = Registry()
+        counter = registry.register(Counter('requests_total', 'Requests.', ('method',)))
+        registry.register(CallbackMetric('cache_size', 'Cache size.', 'gauge', lambda: 7))
+        counter.inc(method='GET')
+        counter.inc(2, method='GET')
+        self.assertEqual(registry.render(), '\n'.join([
+            '# HELP cache_size Cache size.',
+            '# TYPE cache_size gauge',
+            'cache_size 7',
+            '# HELP requests_total Requests.',
+            '# TYPE requests_total counter',
+            'requests_total{method="GET"} 3'
+        ]) + '\n')
+
+    #negative test case that label values cannot break out of the quoted string
+    def test_label_values_are_escaped(self):
+        counter = Counter('requests_total', 'Requests.', ('route',))
+        counter.inc(route='/a"b\\c')
+        self.assertEqual(list(counter.samples()), ['requests_total{route="/a\\"b\\\\c"} 1'])
+
+    #positive test case that connection checkouts from the timed pool are recorded
+    def test_pool_checkout_wait_is_recorded(self):
+        engine = create_engine('sqlite://', poolclass=TimedQueuePool)
+        with engine.connect() as connection:
+            connection.execute('SELECT 1')
+        samples = list(POOL_WAIT_SECONDS.samples())
+        self.assertGreater(len(samples), 0)
+        self.assertTrue(samples[-1].startswith('db_pool_checkout_wait_seconds_count '))
+        self.assertGreaterEqual(int(samples[-1].split()[-1]), 1)
+        engine.dispose()
+
+    #negative test case that a failing statement does not leave its start time on the connection
+    def test_failed_statement_clears_timer(self):
+        instrumentation.install_sql_listeners()
+        engine = create_engine('sqlite://')
+        with engine.connect() as connection:
+            with self.assertRaises(OperationalError):
+                connection.execute(text('SELECT * FROM missing'))
+            self.assertEqual(connection.connection.info['query_started'], [])
+            connection.execute(text('SELECT 1'))
+            self.assertEqual(connection.connection.info['query_started'], [])
+
+
+    #positive and negative test cases that /metrics only answers with the token when one is set
+    def test_metrics_token(self):
+        app = Flask(__name__)
+        instrumentation.init_app(app)
+        client = app.test_client()
+        with mock.patch.object(instrumentation, 'METRICS_TOKEN', 'secret'):
+            self.assertEqual(client.get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code, 200)
+            self.assertEqual(client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code, 401)
+            self.assertEqual(client.get('/metrics', headers={'Authorization': 'Bearer sécret'.encode('utf-8')}).status_code, 401)
+            self.assertEqual(client.get('/metrics').status_code, 401)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import glob
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from flask import Flask
+from sqlalchemy import create_engine, text
+
+import instrumentation
+import profiling
+
+class ProfilingTestCase(unittest.TestCase):
+    """This class represents the request profiling test case"""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.engine = create_engine('sqlite://')
+        instrumentation.install_sql_listeners()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, True)
+
+    def create_app(self, **config):
+        app = Flask(__name__)
+        app.config.update(PROFILE_ENABLED=True, PROFILE_DIR=self.directory, PROFILE_TOKEN='secret')
+        app.config.update(config)
+        profiling.init_app(app)
+
+        @app.route('/things/<int:thing_id>')
+        def thing(thing_id):
+            with self.engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+            return 'ok'
+        return app
+
+    def profiles(self, extension):
+        return sorted(glob.glob(os.path.join(self.directory, '*' + extension)))
+
+    #positive test case that the header with the token profiles the request and records its SQL
+    def test_profile_on_request(self):
+        response = self.create_app().test_client().get('/things/1', headers={'X-Profile': 'secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.profiles('.prof')), 1)
+        self.assertTrue(self.profiles('.prof')[0].endswith('-GET-things_int_thing_id.prof'))
+        with open(self.profiles('.json')[0]) as f:
+            record = json.load(f)
+        self.assertEqual(record['route'], '/things/<int:thing_id>')
+        self.assertEqual(record['status'], 200)
+        self.assertEqual([query['statement'] for query in record['queries']], ['SELECT 1'])
+
+    #negative test case that a wrong token or no header does not profile
+    def test_no_profile_without_token(self):
+        client = self.create_app().test_client()
+        client.get('/things/1', headers={'X-Profile': 'guess'})
+        client.get('/things/1')
+        self.assertEqual(self.profiles('.prof'), [])
+
+    #negative test case that a non-ASCII header is simply no match
+    def test_non_ascii_header(self):
+        response = self.create_app().test_client().get('/things/1', headers={'X-Profile': 'sécret'.encode('utf-8')})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.profiles('.prof'), [])
+
+    #positive test case that a sample rate of 1 profiles every request
+    def test_sampling(self):
+        client = self.create_app(PROFILE_SAMPLE_RATE=1).test_client()
+        client.get('/things/1')
+        client.get('/things/2')
+        self.assertEqual(len(self.profiles('.prof')), 2)
+
+    #negative test case that nothing is hooked in unless profiling is enabled
+    def test_disabled(self):
+        client = self.create_app(PROFILE_ENABLED=False, PROFILE_SAMPLE_RATE=1).test_client()
+        client.get('/things/1', headers={'X-Profile': 'secret'})
+        self.assertEqual(self.profiles('.prof'), [])
+
+    #positive test case that the summary groups profiles by route with their hottest functions
+    def test_summarize(self):
+        client = self.create_app(PROFILE_SAMPLE_RATE=1).test_client()
+        client.get('/things/1')
+        client.get('/things/2')
+        summaries = profiling.summarize(self.directory, top=5, functions=3)
+        self.assertEqual(len(summaries), 1)
+        self.assertEqual(summaries[0]['route'], '/things/<int:thing_id>')
+        self.assertEqual(summaries[0]['requests'], 2)
+        self.assertEqual(summaries[0]['mean_queries'], 1)
+        self.assertEqual(len(summaries[0]['functions']), 3)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+import unittest
+from flask import Flask
+
+from models import setup_db, replica_engine_options, db, Actor
+
+class ReadReplicaTestCase(unittest.TestCase):
+    """This class represents the read replica routing test case, with two SQLite files standing in for PostgreSQL"""
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.primary_path = f"sqlite:///{os.path.join(directory, 'primary.db')}"
+        self.replica_path = f"sqlite:///{os.path.join(directory, 'replica.db')}"
+        self.app = Flask(__name__)
+        setup_db(self.app, self.primary_path, [self.replica_path])
+        self.addCleanup(db.replicas.configure, [])
+        replica = db.replicas.engines[0]
+        db.metadata.create_all(replica)
+        with self.app.app_context():
+            db.create_all()
+            db.session.add(Actor(name='Primary Actor', age=30, gender='Male'))
+            db.session.commit()
+        replica.execute(Actor.__table__.insert(), name='Replica Actor', age=30, gender='Male')
+
+    def actor_names(self):
+        return [actor.name for actor in Actor.query.all()]
+
+    #positive test case that GET requests read from the replica
+    def test_get_reads_from_replica(self):
+        with self.app.test_request_context('/actors', method='GET'):
+            self.assertEqual(self.actor_names(), ['Replica Actor'])
+
+    #positive test case that asking the session for its bind does not keep the reads off the replica
+    def test_get_bind_keeps_replica(self):
+        with self.app.test_request_context('/search', method='GET'):
+            self.assertEqual(db.session.get_bind().dialect.name, 'sqlite')
+            self.assertEqual(self.actor_names(), ['Replica Actor'])
+
+    #negative test case that other methods and code outside a request use the primary
+    def test_writes_use_primary(self):
+        with self.app.test_request_context('/actors', method='POST'):
+            self.assertEqual(self.actor_names(), ['Primary Actor'])
+        with self.app.app_context():
+            self.assertEqual(self.actor_names(), ['Primary Actor'])
+
+    #positive test case that a request reads its own writes from the primary
+    def test_read_after_write_uses_primary(self):
+        with self.app.test_request_context('/actors', method='GET'):
+            Actor(name='New Actor', age=20, gender='Female').insert()
+            self.assertEqual(self.actor_names(), ['Primary Actor', 'New Actor'])
+
+    #negative test case that an unreachable replica falls back to the primary
+    def test_unavailable_replica_falls_back_to_primary(self):
+        setup_db(self.app, self.primary_path, ['sqlite:////nonexistent/directory/replica.db'])
+        with self.app.test_request_context('/actors', method='GET'):
+            self.assertEqual(self.actor_names(), ['Primary Actor'])
+
+    #negative test case that a read failing on a replica that passed its health check is retried on the primary
+    def test_failed_replica_read_retries_on_primary(self):
+        with self.app.test_request_context('/actors', method='GET'):
+            self.assertEqual(self.actor_names(), ['Replica Actor'])
+        db.replicas.engines[0].execute('DROP TABLE actors')
+        with self.app.test_request_context('/actors', method='GET'):
+            self.assertEqual(self.actor_names(), ['Primary Actor'])
+        self.assertIsNone(db.replicas.choose())
+
+    #positive test case that replica connections get a connect timeout on PostgreSQL only
+    def test_replica_connect_timeout(self):
+        options = replica_engine_options('postgresql://replica/castingagency', {'REPLICA_CONNECT_TIMEOUT': 2})
+        self.assertEqual(options['connect_args']['connect_timeout'], 2)
+        self.assertEqual(replica_engine_options('sqlite://', {}), {})
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
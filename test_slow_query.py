@@ -0,0 +1,93 @@
+import datetime
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from sqlalchemy import create_engine, text
+
+import slow_query
+from slow_query import SlowQueryLog, jsonable
+
+def fake_engine(dialect):
+    return SimpleNamespace(dialect=SimpleNamespace(name=dialect))
+
+class SlowQueryLogTestCase(unittest.TestCase):
+    """This class represents the slow query log test case"""
+    #positive test case that only statements over the threshold are kept, newest first
+    def test_threshold(self):
+        log = SlowQueryLog(threshold_ms=100, size=10)
+        log.record(fake_engine('sqlite'), 'SELECT 1', (), 0.05, False)
+        log.record(fake_engine('sqlite'), 'SELECT 2', (), 0.2, False)
+        log.record(fake_engine('sqlite'), 'SELECT 3', (), 0.3, False)
+        entries = log.entries()
+        self.assertEqual([entry['statement'] for entry in entries], ['SELECT 3', 'SELECT 2'])
+        self.assertEqual(entries[0]['duration_ms'], 300)
+        self.assertIsNone(entries[0]['route'])
+        self.assertIsNone(entries[0]['explain'])
+
+    #positive test case that the ring buffer drops the oldest entries
+    def test_ring_buffer(self):
+        log = SlowQueryLog(threshold_ms=1, size=3)
+        for i in range(5):
+            log.record(fake_engine('sqlite'), f'SELECT {i}', (), 1, False)
+        self.assertEqual([entry['statement'] for entry in log.entries()], ['SELECT 4', 'SELECT 3', 'SELECT 2'])
+
+    #negative test case that a threshold of 0 disables the log
+    def test_disabled(self):
+        log = SlowQueryLog(threshold_ms=0)
+        self.assertIsNone(log.record(fake_engine('sqlite'), 'SELECT 1', (), 10, False))
+        self.assertEqual(log.entries(), [])
+
+    #positive test case that executemany keeps only the first parameter sets and their count
+    def test_executemany_parameters(self):
+        log = SlowQueryLog(threshold_ms=1)
+        entry = log.record(fake_engine('sqlite'), 'INSERT INTO actors (name) VALUES (?)', [('a',)] * 50, 1, True)
+        self.assertEqual(entry['parameters']['count'], 50)
+        self.assertEqual(len(entry['parameters']['first']), slow_query.SLOW_QUERY_MAX_PARAMETER_SETS)
+
+    #positive test case that parameters become JSON-serializable
+    def test_jsonable(self):
+        self.assertEqual(jsonable({'d': datetime.date(2024, 1, 31), 'n': [1, None], 'b': b'x'}),
+                         {'d': '2024-01-31', 'n': [1, None], 'b': "b'x'"})
+
+    #positive test case that slow SELECTs on PostgreSQL are explained in the background
+    def test_explain_postgres_selects(self):
+        log = SlowQueryLog(threshold_ms=1, explain=True)
+        with mock.patch.object(slow_query, 'explain', return_value='Seq Scan on actors') as explain:
+            entry = log.record(fake_engine('postgresql'), 'SELECT * FROM actors WHERE age > %(age)s', {'age': 30}, 1, False)
+            deadline = time.monotonic() + 5
+            while entry['explain'] == 'pending' and time.monotonic() < deadline:
+                time.sleep(0.01)
+        self.assertEqual(log.entries()[0]['explain'], 'Seq Scan on actors')
+        self.assertEqual(explain.call_args[0][1:], ('SELECT * FROM actors WHERE age > %(age)s', {'age': 30}))
+
+    #negative test case that writes and other databases are never explained
+    def test_no_explain_for_writes_or_sqlite(self):
+        log = SlowQueryLog(threshold_ms=1, explain=True)
+        self.assertIsNone(log.record(fake_engine('postgresql'), 'DELETE FROM actors', {}, 1, False)['explain'])
+        self.assertIsNone(log.record(fake_engine('sqlite'), 'SELECT 1', (), 1, False)['explain'])
+
+    #positive test case that the engine listeners record statements of any engine
+    def test_engine_listeners(self):
+        slow_query.install_sql_listeners()
+        engine = create_engine('sqlite://')
+        with mock.patch.object(slow_query, 'slow_query_log', SlowQueryLog(threshold_ms=0.000001)) as log:
+            with engine.connect() as connection:
+                connection.execute(text('SELECT :value'), value=7)
+        self.assertEqual(log.entries()[0]['statement'], 'SELECT ?')
+        self.assertEqual(log.entries()[0]['parameters'], [7])
+
+    #negative test case that installing twice does not record every statement twice
+    def test_engine_listeners_installed_once(self):
+        slow_query.install_sql_listeners()
+        slow_query.install_sql_listeners()
+        engine = create_engine('sqlite://')
+        with mock.patch.object(slow_query, 'slow_query_log', SlowQueryLog(threshold_ms=0.000001)) as log:
+            with engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+        self.assertEqual(len(log.entries()), 1)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
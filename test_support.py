@@ -0,0 +1,163 @@
+import atexit
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+import rsa
+from jose import jwt
+from jose.utils import long_to_base64
+from sqlalchemy import event
+
+import auth
+from app import create_app
+from cache import response_cache
+from models import setup_db, db, db_drop_and_create_all
+from stats import stats_cache
+
+'''
+Test support
+Offline fixtures for the test suite. An in-process RSA key pair signs tokens for
+any permission set and a stub JWKS serves its public key to auth.verify_decode_jwt,
+so tokens go through the real verification path without Auth0. The schema is
+created and seeded once per test session; every test then runs in a SAVEPOINT on
+one connection that is rolled back afterwards.
+TEST_DATABASE_URL selects the backend, a temporary SQLite file by default.
+'''
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL')
+
+AUTH0_DOMAIN = 'castingagency.test'
+API_AUDIENCE = 'castingagency-test'
+KID = 'test-key'
+ALL_PERMISSIONS = (
+    'get:actors', 'get:movies', 'post:actors', 'post:movies',
+    'patch:actors', 'patch:movies', 'delete:actors', 'delete:movies'
+)
+
+_public_key, _private_key = rsa.newkeys(1024)  #small key, generated once per session
+_private_pem = _private_key.save_pkcs1()
+
+JWKS = {'keys': [{
+    'kty': 'RSA',
+    'kid': KID,
+    'use': 'sig',
+    'alg': 'RS256',
+    'n': long_to_base64(_public_key.n).decode('ascii'),
+    'e': long_to_base64(_public_key.e).decode('ascii')
+}]}
+
+def make_token(permissions=ALL_PERMISSIONS, expires_in=3600, **claims):
+    '''returns a bearer token signed by the test key, accepted by requires_auth while the stub is installed'''
+    now = int(time.time())
+    payload = {
+        'iss': f'https://{AUTH0_DOMAIN}/',
+        'aud': API_AUDIENCE,
+        'sub': 'test|user',
+        'iat': now,
+        'exp': now + expires_in,
+        'permissions': list(permissions)
+    }
+    payload.update(claims)
+    return jwt.encode(payload, _private_pem, algorithm='RS256', headers={'kid': KID})
+
+def auth_header(permissions=ALL_PERMISSIONS):
+    return {"Authorization": f"Bearer {make_token(permissions)}"}
+
+'''
+install_jwks_stub(jwks)
+    points auth at the test issuer and audience and makes its key store serve jwks,
+    this process's JWKS by default. Returns the started patcher of the auth settings.
+'''
+def install_jwks_stub(jwks=JWKS):
+    patcher = mock.patch.multiple(
+        auth,
+        AUTH0_DOMAIN=AUTH0_DOMAIN,
+        API_AUDIENCE=API_AUDIENCE,
+        ALGORITHMS=['RS256']
+    )
+    patcher.start()
+    auth.jwks_store.fetcher = lambda: jwks  #the store itself stays, other modules hold references to it
+    auth.jwks_store.clear()
+    return patcher
+
+def _sqlite_url():
+    directory = tempfile.mkdtemp(prefix='castingagency-test-')
+    atexit.register(shutil.rmtree, directory, True)
+    return f"sqlite:///{os.path.join(directory, 'test.db')}"
+
+'''
+pysqlite opens transactions on its own schedule and never around SAVEPOINT, which
+breaks nested transactions. Turning its handling off and emitting BEGIN ourselves
+is the workaround from the SQLAlchemy documentation.
+'''
+def _fix_sqlite_savepoints(engine):
+    @event.listens_for(engine, 'connect')
+    def do_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def do_begin(connection):
+        connection.execute('BEGIN')
+
+_app = None
+
+def get_app():
+    '''creates the app, its schema and the seed data on first call, once per test session'''
+    global _app
+    if _app is None:
+        install_jwks_stub()
+        app = create_app()
+        setup_db(app, TEST_DATABASE_URL or _sqlite_url(), [])
+        with app.app_context():
+            if db.engine.dialect.name == 'sqlite':
+                _fix_sqlite_savepoints(db.engine)
+            db_drop_and_create_all()
+            db.session.remove()
+        _app = app
+    return _app
+
+'''
+TransactionFixture
+Binds db.session to one connection inside an outer transaction and a SAVEPOINT.
+The app's commits release the savepoint and its rollbacks roll back to it; either
+way a new one is started, so nothing reaches the database. rollback() discards
+everything the test did and restores db.session.
+'''
+class TransactionFixture:
+    def __init__(self, app):
+        self.app = app
+
+    def start(self):
+        with self.app.app_context():
+            self.connection = db.engine.connect()
+        self.transaction = self.connection.begin()
+        self.original_session = db.session
+        session = db.create_scoped_session(options={'bind': self.connection, 'binds': {}})
+        session.remove = lambda: None  #the app removes the session after every request, keep it for the whole test
+
+        @event.listens_for(session(), 'after_begin')
+        def begin_savepoint(session, transaction, connection):
+            #a new outer session transaction (first use, or after the app closed the session)
+            #gets its SAVEPOINT before its first statement runs
+            if transaction._parent is None:
+                session.begin_nested()
+                session.connection()
+
+        @event.listens_for(session(), 'after_transaction_end')
+        def restart_savepoint(session, transaction):
+            if transaction.nested and not transaction._parent.nested:
+                session.expire_all()
+                session.begin_nested()
+
+        session.connection()  #emits the first SAVEPOINT now rather than inside the test's first request
+        db.session = session
+        response_cache.clear()
+        stats_cache.clear()
+        return self
+
+    def rollback(self):
+        db.session.close()
+        db.session = self.original_session
+        self.transaction.rollback()
+        self.connection.close()